@@ -0,0 +1,411 @@
+import itertools
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Optional
+from unittest import mock
+
+import typer
+from tabulate import tabulate
+
+import execution_manager as em
+import tailer
+
+cli = typer.Typer(no_args_is_help=True)
+
+benchmarks: dict[str, Callable[..., list[dict]]] = {}
+
+
+def benchmark(fn: Callable[..., list[dict]]) -> Callable[..., list[dict]]:
+    benchmarks[fn.__name__] = fn
+    return fn
+
+
+def result(group: str, name: str, value: float, unit: str, **extra) -> dict:
+    return {"group": group, "name": name, "value": value, "unit": unit, **extra}
+
+
+def best_of(fn: Callable[[], None], repeat: int) -> float:
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - started)
+    return min(timings)
+
+
+def generate_log(path: str, size_mb: int) -> None:
+    size = size_mb << 20
+    if os.path.exists(path) and os.path.getsize(path) == size:
+        return
+    line = "2022-03-01 21:00:00 - 12345 - [INFO] Notify: ('震荡策略SHFE.cu2205', 'tick {:08d}')\n"
+    block = "".join(line.format(i) for i in range(8192)).encode()
+    with open(path, "wb") as fp:
+        written = 0
+        while written < size:
+            chunk = block[: size - written]
+            fp.write(chunk)
+            written += len(chunk)
+
+
+def check_lines(what: str, lines: list[bytes], expected: list[bytes]) -> None:
+    # a fast but wrong result must fail the run rather than be recorded
+    if lines != [line.rstrip(b"\r\n") for line in expected]:
+        raise RuntimeError(
+            f"{what} returned {len(lines)} lines not matching the {len(expected)} expected"
+        )
+
+
+@benchmark
+def tailer_bench(
+    workdir: str, size_mb: int, follow_mb: int, repeat: int, **kwargs
+) -> list[dict]:
+    path = os.path.join(workdir, f"log-{size_mb}m.txt")
+    generate_log(path, size_mb)
+    results = []
+
+    # head and tail seek by byte offsets, so only binary mode is measured: in
+    # text mode the offsets are off on a non-ASCII log like this one
+    counts = (10, 1000, 100000)
+    with open(path, "rb") as fp:
+        first = list(itertools.islice(fp, max(counts)))
+        fp.seek(0)
+        last = list(deque(fp, max(counts)))
+    for lines in counts:
+        with open(path, "rb") as fp:
+            check_lines("tail", tailer.Tailer(fp).tail(lines), last[-lines:])
+            t = best_of(lambda: tailer.Tailer(fp).tail(lines), repeat)
+        results.append(result("tailer", f"tail_{lines}_bytes", t * 1e3, "ms"))
+        with open(path, "rb") as fp:
+            check_lines("head", tailer.Tailer(fp).head(lines), first[:lines])
+            t = best_of(lambda: tailer.Tailer(fp).head(lines), repeat)
+        results.append(result("tailer", f"head_{lines}_bytes", t * 1e3, "ms"))
+
+    limit = min(size_mb, follow_mb) << 20
+
+    def follow():
+        with open(path, "r", errors="replace") as fp:
+            for i, _ in enumerate(tailer.Tailer(fp).follow(delay=0)):
+                if i % 4096 == 0 and fp.tell() >= limit:
+                    break
+
+    t = best_of(follow, repeat)
+    results.append(result("tailer", "follow", (limit >> 20) / t, "MB/s"))
+
+    def follow_bytes():
+        with open(path, "rb") as fp:
+            for i, _ in enumerate(tailer.Tailer(fp).follow(delay=0)):
+                if i % 4096 == 0 and fp.tell() >= limit:
+                    break
+
+    t = best_of(follow_bytes, repeat)
+    results.append(result("tailer", "follow_bytes", (limit >> 20) / t, "MB/s"))
+    return results
+
+
+@benchmark
+def execution_bench(workdir: str, executions: int, repeat: int, **kwargs) -> list[dict]:
+    home = os.path.join(workdir, f"app-{executions}")
+    app = em.App(home=home, name="bench", runner=lambda e: None)
+    if len(os.listdir(home)) != executions:
+        dead = subprocess.Popen([sys.executable, "-c", "pass"])
+        dead.wait()
+        for i in range(executions):
+            e = em.Execution(os.path.join(home, f"e{i:04d}"), f"e{i:04d}")
+            e.init()
+            # a third running, a third stopped with a stale pid, a third never started
+            if i % 3 == 0:
+                e.write_text("__pid__", str(os.getpid()))
+            elif i % 3 == 1:
+                e.write_text("__pid__", str(dead.pid))
+
+    t_list = best_of(app.execution_list, repeat)
+    es = app.execution_list()
+    t_status = best_of(lambda: [e.status() for e in es], repeat)
+    t_config = best_of(lambda: [e.read_config() for e in es], repeat)
+    t_all = best_of(
+        lambda: [(e.status(), e.read_config()) for e in app.execution_list()],
+        repeat,
+    )
+    return [
+        result("execution", "execution_list", t_list * 1e3, "ms", n=executions),
+        result("execution", "status", t_status / executions * 1e3, "ms/execution"),
+        result("execution", "read_config", t_config / executions * 1e3, "ms/execution"),
+        result("execution", "list", t_all * 1e3, "ms", n=executions),
+    ]
+
+
+@contextmanager
+def http_stand_in():
+    received = []
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            received.append(self.path)
+            self.send_response(200)
+            self.send_header("Content-Length", "2")
+            self.end_headers()
+            self.wfile.write(b"{}")
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    try:
+        yield server.server_address[1], received
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+@benchmark
+def notifier_bench(workdir: str, messages: int, **kwargs) -> list[dict]:
+    ws = em.Workspace(os.path.join(workdir, "notifier"), "bench-notifier")
+    os.makedirs(ws.home, exist_ok=True)
+    ws.logger.propagate = False
+
+    with http_stand_in() as (port, received):
+        noti = em.Notifier(logger=ws.logger, telegram={"bot": "x", "channel": "1"})
+        noti.telegram_channel_url = f"http://127.0.0.1:{port}/sendMessage?text={{}}"
+        noti.start()
+
+        started = time.perf_counter()
+        for i in range(messages):
+            noti.send(f"message {i}")
+        enqueued = time.perf_counter() - started
+        while len(received) < messages and time.perf_counter() - started < 120:
+            time.sleep(0.001)
+        elapsed = time.perf_counter() - started
+        noti.queue.put(None)
+
+    return [
+        result("notifier", "send", enqueued / messages * 1e6, "us/message"),
+        result("notifier", "delivered", len(received) / elapsed, "messages/s"),
+    ]
+
+
+class FeedFinished(Exception):
+    pass
+
+
+class FakeObject:
+    def __init__(self, **fields) -> None:
+        self.__dict__.update(fields)
+
+
+class FakeApi:
+    def __init__(self, prices: list[float]) -> None:
+        self.prices = prices
+        self.index = -1
+        self.quote = FakeObject(
+            last_price=float("nan"),
+            volume_multiple=5,
+            datetime="2022-03-01 21:00:00.000000",
+        )
+        self.position = FakeObject(pos_long=0, pos_long_his=0, pos_long_today=0)
+
+    def get_quote(self, symbol: str) -> FakeObject:
+        return self.quote
+
+    def get_position(self, symbol: str) -> FakeObject:
+        return self.position
+
+    def wait_update(self, deadline: float = None) -> bool:
+        if deadline is not None and deadline <= time.time():
+            # a live feed that keeps up, nothing is backlogged
+            return False
+        self.index += 1
+        if self.index >= len(self.prices):
+            raise FeedFinished()
+        self.quote.last_price = self.prices[self.index]
+        return True
+
+    def is_changing(self, obj: FakeObject, field: str) -> bool:
+        return obj is self.quote and field == "last_price"
+
+    def close(self) -> None:
+        pass
+
+
+class FakeTargetPosTask:
+    def __init__(self, api: FakeApi, symbol: str, **kwargs) -> None:
+        self.api = api
+
+    def set_target_volume(self, volume: int) -> None:
+        self.api.position.pos_long = volume
+
+
+def synthetic_prices(ticks: int, low: float, high: float) -> list[float]:
+    # a random walk reflected inside (low, high)
+    rnd = random.Random(42)
+    price = (low + high) / 2
+    prices = []
+    for _ in range(ticks):
+        price += rnd.choice((-1, 1)) * rnd.randint(0, 3)
+        if price <= low or price >= high:
+            price = (low + high) / 2
+        prices.append(price)
+    return prices
+
+
+@benchmark
+def strategy_bench(workdir: str, ticks: int, **kwargs) -> list[dict]:
+    # the app is built when the module is imported, keep its home out of the
+    # user's real ~/.quant-future
+    home = os.path.join(workdir, "home")
+    with mock.patch.dict(os.environ, {"HOME": home, "USERPROFILE": home}):
+        import tq_box_trading as tq
+
+    e = em.Execution(os.path.join(workdir, "strategy"), "bench-strategy")
+    e.init()
+    e.logger.propagate = False
+    config = {
+        **tq.config_schema,
+        "contract.name": "SHFE.cu2205",
+        "resistance": 72000,
+        "support": 68000,
+        "budget": 1000000,
+    }
+    e.write_config(config)
+    params = tq.box_params(config)
+    prices = synthetic_prices(
+        ticks, params["stop_loss"] + 10, params["resistance"] - 10
+    )
+
+    api = FakeApi(prices)
+    with mock.patch.object(tq, "get_api", lambda e: api), mock.patch(
+        "tqsdk.TargetPosTask", FakeTargetPosTask
+    ):
+        started = time.perf_counter()
+        try:
+            tq.strategy(e)
+        except FeedFinished:
+            pass
+        elapsed = time.perf_counter() - started
+
+    return [result("strategy", "tick", elapsed / ticks * 1e6, "us/tick", n=ticks)]
+
+
+def environment() -> dict:
+    try:
+        revision = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=em.script_dir,
+            capture_output=True,
+            text=True,
+        ).stdout.strip()
+    except OSError:
+        revision = ""
+    return {
+        "time": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "revision": revision,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+    }
+
+
+@cli.command(help="Run the benchmarks")
+def run(
+    only: Optional[list[str]] = typer.Option(
+        None, help=f"Benchmarks to run: {', '.join(benchmarks)}"
+    ),
+    output: Optional[str] = typer.Option(None, "-o", help="Write results as JSON"),
+    workdir: str = typer.Option(
+        os.path.join(tempfile.gettempdir(), "quant-future-bench"),
+        help="Where generated data is kept between runs",
+    ),
+    size_mb: int = typer.Option(2048, help="Size of the generated log"),
+    follow_mb: int = typer.Option(256, help="Data read by the follow benchmark"),
+    executions: int = typer.Option(300, help="Number of synthetic executions"),
+    messages: int = typer.Option(2000, help="Notifications to deliver"),
+    ticks: int = typer.Option(100000, help="Synthetic quotes fed to the strategy"),
+    repeat: int = typer.Option(3, help="Best of N runs"),
+):
+    os.makedirs(workdir, exist_ok=True)
+    results = []
+    for name, fn in benchmarks.items():
+        if only and name.removesuffix("_bench") not in only and name not in only:
+            continue
+        typer.echo(f"Running {name} ...", err=True)
+        results += fn(
+            workdir=workdir,
+            size_mb=size_mb,
+            follow_mb=follow_mb,
+            executions=executions,
+            messages=messages,
+            ticks=ticks,
+            repeat=repeat,
+        )
+
+    typer.echo(
+        tabulate(
+            [(r["group"], r["name"], f"{r['value']:.3f}", r["unit"]) for r in results],
+            headers=["group", "benchmark", "value", "unit"],
+        )
+    )
+    if output:
+        with open(output, "w") as fp:
+            json.dump({"environment": environment(), "results": results}, fp, indent=2)
+
+
+# units where a larger value is better
+higher_is_better = ("MB/s", "messages/s")
+
+
+@cli.command(help="Compare two result files")
+def compare(
+    baseline: str,
+    current: str,
+    threshold: float = typer.Option(0.1, help="Relative change flagged as regression"),
+):
+    def load(fn: str) -> dict:
+        with open(fn) as fp:
+            return {(r["group"], r["name"]): r for r in json.load(fp)["results"]}
+
+    base, cur = load(baseline), load(current)
+    rows = []
+    regressions = 0
+    for key, r in cur.items():
+        if not (b := base.get(key)) or not b["value"]:
+            continue
+        change = r["value"] / b["value"] - 1
+        worse = -change if r["unit"] in higher_is_better else change
+        flag = worse > threshold and "REGRESSION" or ""
+        regressions += bool(flag)
+        rows.append(
+            (
+                *key,
+                f"{b['value']:.3f}",
+                f"{r['value']:.3f}",
+                r["unit"],
+                f"{change:+.1%}",
+                flag,
+            )
+        )
+
+    typer.echo(
+        tabulate(
+            rows,
+            headers=["group", "benchmark", "baseline", "current", "unit", "change", ""],
+        )
+    )
+    if regressions:
+        raise typer.Exit(1)
+
+
+if __name__ == "__main__":
+    cli()
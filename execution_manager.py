@@ -1,18 +1,28 @@
 import queue
+import select
 import socket
+from concurrent.futures import ThreadPoolExecutor
 from contextlib import closing
+from collections import deque
 from enum import Enum
+from fnmatch import fnmatch
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 import json
 import os
+import random
 import signal
 from subprocess import Popen
 import sys
 import threading
+import time
 from typing import Any, Callable, Optional
 import psutil
 import logging
 from functools import cached_property
+import gzip
+import mmap
 import shutil
+import struct
 
 import dataset
 import pandas as pd
@@ -21,6 +31,8 @@ import questionary
 import requests
 import notifypy
 
+import tailer
+
 
 on_windows = sys.platform == "win32"
 script_dir = os.path.abspath(os.path.split(__file__)[0])
@@ -38,6 +50,49 @@ def get_free_port():
         return s.getsockname()[1]
 
 
+def port_available(port: int) -> bool:
+    with closing(socket.socket(socket.AF_INET, socket.SOCK_STREAM)) as s:
+        s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        try:
+            s.bind(("", port))
+            return True
+        except OSError:
+            return False
+
+
+def wait_pid(pid: int, timeout: float) -> bool:
+    """\
+    Wait up to ``timeout`` seconds for any process (not only a child) to exit,
+    return whether it did. On Linux the process is polled through a pidfd so
+    the wait sleeps in the kernel, elsewhere psutil polls it.
+    """
+    if hasattr(os, "pidfd_open"):
+        try:
+            fd = os.pidfd_open(pid)
+        except ProcessLookupError:
+            return True
+        except OSError:
+            pass
+        else:
+            try:
+                p = select.poll()
+                p.register(fd, select.POLLIN)
+                return bool(p.poll(max(timeout, 0) * 1000))
+            finally:
+                os.close(fd)
+    try:
+        psutil.Process(pid).wait(timeout)
+        return True
+    except psutil.NoSuchProcess:
+        return True
+    except psutil.TimeoutExpired:
+        return False
+
+
+def is_pattern(name: str) -> bool:
+    return bool(set(name) & set("*?["))
+
+
 def edit_file(fn, open_with=None):
     if on_windows:
         os.system(f"{open_with or 'notepad'} '{fn}'")
@@ -45,6 +100,229 @@ def edit_file(fn, open_with=None):
         os.system(f"{open_with or 'code'} '{fn}'")
 
 
+class RingBufferHandler(logging.Handler):
+    """\
+    Keep the most recent formatted records in memory, at most ``max_bytes``
+    characters in total, until they are dumped to a file. Records are
+    formatted when they arrive: an unformatted LogRecord would keep its
+    arguments (whole SDK data packets) alive, several KB each.
+    """
+
+    def __init__(self, max_bytes: int = 32 << 20) -> None:
+        super().__init__(logging.DEBUG)
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.lines = deque()
+
+    def emit(self, record: logging.LogRecord) -> None:
+        try:
+            line = self.format(record)
+        except Exception:
+            self.handleError(record)
+            return
+        self.lines.append(line)
+        self.size += len(line)
+        while self.size > self.max_bytes and self.lines:
+            self.size -= len(self.lines.popleft())
+
+    def dump(self, path: str) -> int:
+        with self.lock:
+            lines, self.lines, self.size = self.lines, deque(), 0
+        with open(path, "a", encoding="utf-8") as fp:
+            for line in lines:
+                fp.write(line + "\n")
+        return len(lines)
+
+
+class LogRotator:
+    def __init__(
+        self, max_bytes: int = 0, backup_count: int = 20, compression: str = "gzip"
+    ) -> None:
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self.compression = compression
+        # compressing and pruning run on several threads (handler rollovers,
+        # the rotator thread, startup), one at a time
+        self.lock = threading.Lock()
+        if compression == "zstd":
+            try:
+                import zstandard
+            except ImportError:
+                self.compression = "gzip"
+
+    def should_rotate(self, path: str) -> bool:
+        try:
+            return bool(self.max_bytes) and os.path.getsize(path) >= self.max_bytes
+        except OSError:
+            return False
+
+    def rotate(self, path: str, copy_truncate: bool = False) -> str:
+        segments = tailer.log_segments(path)
+        number = segments and tailer.segment_number(segments[-1]) + 1 or 1
+        segment = f"{path}.{number:06d}"
+        if copy_truncate:
+            # for files kept open by other writers in append mode
+            shutil.copyfile(path, segment)
+            os.truncate(path, 0)
+        else:
+            os.replace(path, segment)
+
+        thread = threading.Thread(target=self.compress, args=(path, segment))
+        thread.daemon = True
+        thread.start()
+        return segment
+
+    def compress(self, path: str, segment: str) -> None:
+        with self.lock:
+            self._compress(path, segment)
+
+    def _compress(self, path: str, segment: str) -> None:
+        # another thread may have compressed or pruned the segment already
+        if self.compression in ("gzip", "zstd") and os.path.isfile(segment):
+            output = segment + (self.compression == "gzip" and ".gz" or ".zst")
+            tmp = output + ".tmp"
+            with open(segment, "rb") as src:
+                if self.compression == "gzip":
+                    with gzip.open(tmp, "wb") as dst:
+                        shutil.copyfileobj(src, dst, 1 << 20)
+                else:
+                    import zstandard
+
+                    with open(tmp, "wb") as fp:
+                        zstandard.ZstdCompressor().copy_stream(src, fp)
+            os.replace(tmp, output)
+            os.remove(segment)
+
+        if self.backup_count:
+            for old in tailer.log_segments(path)[: -self.backup_count]:
+                try:
+                    os.remove(old)
+                except OSError:
+                    pass
+
+    def compress_pending(self, path: str) -> None:
+        # segments left plain by a process that exited while compressing
+        for segment in tailer.log_segments(path):
+            if not segment.endswith((".gz", ".zst")):
+                self.compress(path, segment)
+
+
+class RotatingLogHandler(logging.FileHandler):
+    def __init__(self, filename: str, rotator: LogRotator) -> None:
+        super().__init__(filename)
+        self.rotator = rotator
+
+    def emit(self, record: logging.LogRecord) -> None:
+        super().emit(record)
+        self.maybe_rollover()
+
+    def maybe_rollover(self) -> None:
+        if not (self.rotator.max_bytes and self.stream):
+            return
+        if self.stream.tell() < self.rotator.max_bytes:
+            return
+        self.stream.close()
+        self.stream = None
+        self.rotator.rotate(self.baseFilename)
+        self.stream = self._open()
+
+
+class QueueLogHandler(logging.Handler):
+    def __init__(
+        self, target: logging.Handler, maxsize: int = 10000, batch_size: int = 512
+    ) -> None:
+        super().__init__(target.level)
+        self.target = target
+        self.batch_size = batch_size
+        self.queue = queue.Queue(maxsize)
+        self.dropped = 0
+        self.reported_dropped = 0
+        self.thread = threading.Thread(target=self.run, name="log-writer")
+        self.thread.daemon = True
+        self.thread.start()
+
+    def emit(self, record: logging.LogRecord) -> None:
+        # the caller only merges the arguments into the message, so later
+        # changes of mutable arguments don't show up, formatting and I/O
+        # happen on the writer thread
+        try:
+            record.msg = record.getMessage()
+            record.args = None
+        except Exception:
+            self.handleError(record)
+            return
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def run(self) -> None:
+        while True:
+            batch = [self.queue.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            self.write([r for r in batch if isinstance(r, logging.LogRecord)])
+            for item in batch:
+                if isinstance(item, threading.Event):
+                    item.set()
+            if None in batch:
+                return
+
+    def write(self, records: list[logging.LogRecord]) -> None:
+        if self.dropped != self.reported_dropped:
+            records.append(
+                logging.makeLogRecord(
+                    {
+                        "name": records and records[0].name or "",
+                        "levelno": logging.WARNING,
+                        "levelname": "WARNING",
+                        "msg": f"Log queue full, {self.dropped - self.reported_dropped} records dropped",
+                    }
+                )
+            )
+            self.reported_dropped = self.dropped
+        if not records:
+            return
+
+        lines = []
+        for record in records:
+            try:
+                lines.append(self.target.format(record) + self.target.terminator)
+            except Exception:
+                self.target.handleError(record)
+        self.target.acquire()
+        try:
+            self.target.stream.write("".join(lines))
+            self.target.stream.flush()
+            if isinstance(self.target, RotatingLogHandler):
+                self.target.maybe_rollover()
+        except Exception:
+            self.target.handleError(records[-1])
+        finally:
+            self.target.release()
+
+    def flush(self, timeout: float = 5.0) -> None:
+        if not self.thread.is_alive():
+            return
+        done = threading.Event()
+        try:
+            self.queue.put(done, timeout=timeout)
+        except queue.Full:
+            return
+        done.wait(timeout)
+
+    def close(self) -> None:
+        if self.thread.is_alive():
+            self.flush()
+            self.queue.put(None)
+            self.thread.join(5.0)
+        self.target.close()
+        super().close()
+
+
 class Notifier:
     def __init__(
         self,
@@ -100,6 +378,342 @@ class Notifier:
         self.queue.put((title or self.title, message))
 
 
+class Backoff:
+    def __init__(
+        self, *, base: float = 0.1, cap: float = 180.0, factor: float = 2.0
+    ) -> None:
+        self.base = base
+        self.cap = cap
+        self.factor = factor
+        self.attempts = 0
+
+    def next(self) -> float:
+        # exponential growth with full jitter between base and the current ceiling
+        ceiling = min(self.cap, self.base * self.factor ** min(self.attempts, 64))
+        self.attempts += 1
+        return random.uniform(min(self.base, ceiling), ceiling)
+
+    def reset(self) -> None:
+        self.attempts = 0
+
+
+def escape_label(value: str) -> str:
+    # label values in the Prometheus text format escape backslash, quote and newline
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class Metrics:
+    """\
+    Counters and gauges of one process, rendered in the Prometheus text format.
+    >>> m = Metrics({"execution": 'box "a"\\\\b'})
+    >>> m.inc("ticks_total")
+    >>> m.counter("cpu_seconds_total", lambda: 1.5)
+    >>> print(m.render(), end="")
+    # TYPE cpu_seconds_total counter
+    cpu_seconds_total{execution="box \\"a\\"\\\\b"} 1.5
+    # TYPE ticks_total counter
+    ticks_total{execution="box \\"a\\"\\\\b"} 1.0
+    """
+
+    # window (seconds) used to compute the per-second rates of counters
+    rate_window = 10.0
+
+    def __init__(self, labels: dict[str, str] = None) -> None:
+        self.labels = ",".join(
+            f'{k}="{escape_label(v)}"' for k, v in (labels or {}).items()
+        )
+        self.counters: dict[str, float] = {}
+        self.counter_fns: dict[str, Callable[[], float]] = {}
+        self.gauges: dict[str, Any] = {}
+        self.rates: dict[str, tuple[str, deque]] = {}
+        self.started_at = time.monotonic()
+
+    def inc(self, name: str, value: float = 1) -> None:
+        self.counters[name] = self.counters.get(name, 0) + value
+
+    def set(self, name: str, value: float) -> None:
+        self.gauges[name] = value
+
+    def gauge(self, name: str, fn: Callable[[], float]) -> None:
+        # evaluated when scraped
+        self.gauges[name] = fn
+
+    def counter(self, name: str, fn: Callable[[], float]) -> None:
+        # a monotonic total kept elsewhere, evaluated when scraped
+        self.counter_fns[name] = fn
+
+    def rate(self, counter: str, name: str = None) -> None:
+        # per-second rate of a counter over the last rate_window seconds
+        name = name or f"{counter.removesuffix('_total')}_per_second"
+        self.rates[name] = (counter, deque([(self.started_at, 0)]))
+
+    def sample(self) -> dict[str, tuple[str, float]]:
+        now = time.monotonic()
+        values = {k: ("counter", v) for k, v in list(self.counters.items())}
+        for k, fn in list(self.counter_fns.items()):
+            try:
+                values[k] = ("counter", fn())
+            except Exception:
+                continue
+        for k, v in list(self.gauges.items()):
+            try:
+                values[k] = ("gauge", v() if callable(v) else v)
+            except Exception:
+                continue
+        for k, (counter, window) in list(self.rates.items()):
+            current = self.counters.get(counter, 0)
+            window.append((now, current))
+            while len(window) > 2 and now - window[1][0] >= self.rate_window:
+                window.popleft()
+            t0, v0 = window[0]
+            values[k] = ("gauge", now > t0 and (current - v0) / (now - t0) or 0)
+        return values
+
+    def render(self) -> str:
+        labels = self.labels and f"{{{self.labels}}}" or ""
+        lines = []
+        for name, (kind, value) in sorted(self.sample().items()):
+            if value is None:
+                continue
+            lines.append(f"# TYPE {name} {kind}")
+            lines.append(f"{name}{labels} {float(value)}")
+        return "\n".join(lines) + "\n"
+
+    def serve(self, host: str = "127.0.0.1", port: int = 0) -> ThreadingHTTPServer:
+        metrics = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] not in ("/", "/metrics"):
+                    self.send_error(404)
+                    return
+                body = metrics.render().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        server = ThreadingHTTPServer((host, port), Handler)
+        server.daemon_threads = True
+        thread = threading.Thread(target=server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        return server
+
+
+def process_metrics(metrics: Metrics) -> None:
+    proc = psutil.Process()
+    proc.cpu_percent()
+    metrics.gauge("process_resident_memory_bytes", lambda: proc.memory_info().rss)
+    metrics.gauge("process_cpu_percent", lambda: proc.cpu_percent())
+    metrics.counter("process_cpu_seconds_total", lambda: sum(proc.cpu_times()[:2]))
+    metrics.gauge("process_threads", proc.num_threads)
+    if not on_windows:
+        metrics.gauge("process_open_fds", proc.num_fds)
+
+
+class SharedState:
+    """\
+    A fixed layout record of float fields in a memory-mapped file, written by
+    one process and read by any other without locks or syscalls.
+
+    The record starts with a sequence number that is odd while the writer is
+    updating the fields; readers retry until they copy the fields between two
+    reads of the same even number.
+    """
+
+    def __init__(self, mm: mmap.mmap, fields: tuple[str, ...]) -> None:
+        self.mm = mm
+        self.fields = fields
+        self.record = struct.Struct("<Q" + "d" * len(fields))
+        self.values = [float("nan")] * len(fields)
+        self.index = {f: i for i, f in enumerate(fields)}
+
+    @classmethod
+    def create(cls, path: str, fields: tuple[str, ...]) -> "SharedState":
+        size = 8 + 8 * len(fields)
+        if not (os.path.isfile(path) and os.path.getsize(path) == size):
+            # replaced rather than truncated under readers that have it mapped
+            tmp = f"{path}.{os.getpid()}.tmp"
+            with open(tmp, "wb") as fp:
+                fp.truncate(size)
+            os.replace(tmp, path)
+        with open(path, "r+b") as fp:
+            state = cls(mmap.mmap(fp.fileno(), size), fields)
+        # a restarted writer keeps publishing the last known values
+        if previous := state.read():
+            state.values = list(previous.values())
+        return state
+
+    @classmethod
+    def open(cls, path: str, fields: tuple[str, ...]) -> Optional["SharedState"]:
+        try:
+            with open(path, "rb") as fp:
+                mm = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            return None
+        if len(mm) != 8 + 8 * len(fields):
+            mm.close()
+            return None
+        return cls(mm, fields)
+
+    def close(self) -> None:
+        self.mm.close()
+
+    def update(self, **values: float) -> None:
+        for k, v in values.items():
+            self.values[self.index[k]] = v
+        seq = struct.unpack_from("<Q", self.mm, 0)[0] | 1
+        struct.pack_into("<Q", self.mm, 0, seq)
+        self.record.pack_into(self.mm, 0, seq, *self.values)
+        struct.pack_into("<Q", self.mm, 0, seq + 1)
+
+    def read(self, retries: int = 100) -> Optional[dict[str, float]]:
+        for _ in range(retries):
+            seq, *values = self.record.unpack_from(self.mm, 0)
+            if seq & 1 or struct.unpack_from("<Q", self.mm, 0)[0] != seq:
+                continue
+            return seq and dict(zip(self.fields, values)) or None
+        return None
+
+
+class SampleRing:
+    """\
+    Fixed size ring of float records in a memory-mapped file, appended by one
+    process and read by any other. Each slot carries the sequence number it
+    was written with and is cleared while being written, so a reader can tell
+    a complete record from an overwritten or half written one.
+
+    >>> import tempfile
+    >>> path = os.path.join(tempfile.mkdtemp(), "ring")
+    >>> ring = SampleRing.create(path, ("value",), 4)
+    >>> for i in range(1, 11):
+    ...     ring.append({"value": i})
+    ...     assert ring.latest() == {"value": i}
+    >>> ring.write_seq
+    10
+    >>> [s["value"] for s in ring.history()]
+    [7.0, 8.0, 9.0, 10.0]
+    >>> reader = SampleRing.open(path, ("value",))
+    >>> [s["value"] for s in reader.history(2)]
+    [9.0, 10.0]
+    >>> reader.close(); ring.close()
+    """
+
+    # header: magic, capacity, field count, write sequence
+    header = struct.Struct("<4sIIQ")
+    write_seq_offset = header.size - 8
+    magic = b"QFSR"
+
+    def __init__(self, mm: mmap.mmap, fields: tuple[str, ...]) -> None:
+        self.mm = mm
+        self.fields = fields
+        self.record = struct.Struct("<Q" + "d" * len(fields))
+        self.capacity = self.header.unpack_from(mm, 0)[1]
+
+    @classmethod
+    def create(cls, path: str, fields: tuple[str, ...], capacity: int) -> "SampleRing":
+        if ring := cls.open(path, fields, writable=True):
+            if ring.capacity == capacity:
+                return ring
+            ring.close()
+        size = cls.header.size + capacity * (8 + 8 * len(fields))
+        # a new file replaces the old one, truncating a file that readers have
+        # mapped would fault them on their next access
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "wb") as fp:
+            fp.write(cls.header.pack(cls.magic, capacity, len(fields), 0))
+            fp.truncate(size)
+        os.replace(tmp, path)
+        return cls.open(path, fields, writable=True)
+
+    @classmethod
+    def open(
+        cls, path: str, fields: tuple[str, ...], writable: bool = False
+    ) -> Optional["SampleRing"]:
+        try:
+            with open(path, writable and "r+b" or "rb") as fp:
+                mm = mmap.mmap(
+                    fp.fileno(),
+                    0,
+                    access=writable and mmap.ACCESS_WRITE or mmap.ACCESS_READ,
+                )
+        except (OSError, ValueError):
+            return None
+        magic, capacity, count, _ = cls.header.unpack_from(mm, 0)
+        if (
+            magic != cls.magic
+            or count != len(fields)
+            or len(mm) != cls.header.size + capacity * (8 + 8 * count)
+        ):
+            mm.close()
+            return None
+        return cls(mm, fields)
+
+    def close(self) -> None:
+        self.mm.close()
+
+    @property
+    def write_seq(self) -> int:
+        return struct.unpack_from("<Q", self.mm, self.write_seq_offset)[0]
+
+    def offset(self, seq: int) -> int:
+        return self.header.size + (seq - 1) % self.capacity * self.record.size
+
+    def append(self, sample: dict[str, float]) -> None:
+        seq = self.write_seq + 1
+        offset = self.offset(seq)
+        struct.pack_into("<Q", self.mm, offset, 0)
+        self.record.pack_into(
+            self.mm,
+            offset,
+            0,
+            *(float(sample.get(f, float("nan"))) for f in self.fields),
+        )
+        struct.pack_into("<Q", self.mm, offset, seq)
+        struct.pack_into("<Q", self.mm, self.write_seq_offset, seq)
+
+    def get(self, seq: int) -> Optional[dict[str, float]]:
+        if seq < 1:
+            return None
+        offset = self.offset(seq)
+        values = self.record.unpack_from(self.mm, offset)
+        if values[0] != seq or struct.unpack_from("<Q", self.mm, offset)[0] != seq:
+            return None
+        return dict(zip(self.fields, values[1:]))
+
+    def latest(self) -> Optional[dict[str, float]]:
+        return self.get(self.write_seq)
+
+    def history(self, count: int = None) -> list[dict[str, float]]:
+        """The last ``count`` samples, oldest first."""
+        last = self.write_seq
+        count = min(count or self.capacity, self.capacity, last)
+        return [s for seq in range(last - count + 1, last + 1) if (s := self.get(seq))]
+
+
+USAGE_FILE_NAME = "__usage__"
+usage_fields = ("time", "pid", "cpu_percent", "cpu_seconds", "rss", "fds", "threads")
+
+
+def sample_usage(proc: psutil.Process) -> dict[str, float]:
+    with proc.oneshot():
+        cpu = proc.cpu_times()
+        return {
+            "time": time.time(),
+            "pid": proc.pid,
+            "cpu_percent": proc.cpu_percent(),
+            "cpu_seconds": cpu.user + cpu.system,
+            "rss": proc.memory_info().rss,
+            "fds": proc.num_handles() if on_windows else proc.num_fds(),
+            "threads": proc.num_threads(),
+        }
+
+
 class ExecutionException(Exception):
     pass
 
@@ -131,6 +745,73 @@ class ExecutionStatus(str, Enum):
 
 
 CONFIG_FILE_NAME = "config.json"
+PROFILE_FILE_NAME = "__profile__"
+
+
+class SamplingProfiler:
+    def __init__(self) -> None:
+        self.thread: threading.Thread = None
+        self.stopping = threading.Event()
+
+    @property
+    def running(self) -> bool:
+        return bool(self.thread and self.thread.is_alive())
+
+    def start(
+        self,
+        output: str,
+        seconds: float = 10,
+        interval: float = 0.005,
+        on_done: Callable[[str, int], None] = None,
+    ) -> None:
+        if self.running:
+            return
+        self.stopping.clear()
+        self.thread = threading.Thread(
+            target=self.run, args=(output, seconds, interval, on_done)
+        )
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self) -> None:
+        self.stopping.set()
+
+    def run(
+        self,
+        output: str,
+        seconds: float,
+        interval: float,
+        on_done: Callable[[str, int], None],
+    ) -> None:
+        me = threading.get_ident()
+        stacks: dict[str, int] = {}
+        samples = 0
+        deadline = time.monotonic() + seconds
+
+        while not self.stopping.wait(interval) and time.monotonic() < deadline:
+            names = {t.ident: t.name for t in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == me:
+                    continue
+                frames = []
+                while frame:
+                    code = frame.f_code
+                    frames.append(
+                        f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})"
+                    )
+                    frame = frame.f_back
+                frames.append(names.get(ident, str(ident)))
+                stack = ";".join(reversed(frames))
+                stacks[stack] = stacks.get(stack, 0) + 1
+            samples += 1
+
+        # collapsed stacks, one "frame;frame;... count" per line, for flamegraph.pl/speedscope
+        with open(output, "w") as fp:
+            for stack, count in sorted(stacks.items()):
+                fp.write(f"{stack} {count}\n")
+
+        if on_done:
+            on_done(output, samples)
 
 
 def normabspath(path: str) -> str:
@@ -138,6 +819,13 @@ def normabspath(path: str) -> str:
 
 
 class Workspace:
+    # log through QueueLogHandler, must be set before logger is first used
+    async_logging = False
+    # roll log files over this size, 0 to never roll
+    log_max_bytes = 0
+    log_backup_count = 20
+    log_compression = "gzip"
+
     def __init__(self, home: str, name: str = None) -> None:
         self.home = normabspath(home)
         self.name = self.name = (
@@ -188,10 +876,14 @@ class Workspace:
         return self.file("log.txt")
 
     @cached_property
-    def logger(self) -> logging.Logger:
-        logger = logging.getLogger(self.name)
-        logger.setLevel(logging.INFO)
-        fh = logging.FileHandler(self.log_file)
+    def log_rotator(self) -> LogRotator:
+        return LogRotator(
+            self.log_max_bytes, self.log_backup_count, self.log_compression
+        )
+
+    @cached_property
+    def log_handler(self) -> logging.Handler:
+        fh = RotatingLogHandler(self.log_file, self.log_rotator)
         fh.setLevel(logging.DEBUG)
         fh.setFormatter(
             logging.Formatter(
@@ -199,16 +891,40 @@ class Workspace:
                 datefmt="%Y-%m-%d %H:%M:%S",
             )
         )
-        logger.addHandler(fh)
+        return self.async_logging and QueueLogHandler(fh) or fh
+
+    @cached_property
+    def logger(self) -> logging.Logger:
+        logger = logging.getLogger(self.name)
+        logger.setLevel(logging.INFO)
+        logger.addHandler(self.log_handler)
+        if self.async_logging:
+            # the console handler of the root logger would format on the caller's thread
+            logger.propagate = False
 
         return logger
 
+    def flush_logs(self) -> None:
+        if "log_handler" in self.__dict__:
+            self.log_handler.flush()
+
     @cached_property
     def db(self) -> dataset.Database:
         return dataset.connect(f"sqlite:///{self.file('__db__')}")
 
 
 class Execution(Workspace):
+    # seconds between two mtime checks in poll_config
+    config_poll_interval = 1.0
+
+    _config: dict = None
+    _config_stamp: tuple = None
+    _config_polled_at: float = 0.0
+
+    @cached_property
+    def metrics(self) -> Metrics:
+        return Metrics({"execution": self.name})
+
     @cached_property
     def pid_file(self) -> str:
         return self.file("__pid__")
@@ -255,15 +971,144 @@ class Execution(Workspace):
         with open(self.pid_file, "w") as fp:
             fp.write(str(pid))
 
+    def config_stamp(self) -> tuple:
+        try:
+            st = os.stat(self.config_file)
+            return st.st_mtime_ns, st.st_size
+        except OSError:
+            return None
+
     def read_config(self) -> dict:
-        return self.read_json(CONFIG_FILE_NAME, safe=True)
+        stamp = self.config_stamp()
+        if self._config is None or stamp != self._config_stamp:
+            self._config = self.read_json(CONFIG_FILE_NAME, safe=True)
+            self._config_stamp = stamp
+        return dict(self._config)
 
     def write_config(self, data: dict) -> None:
+        self._config = None
         return self.write_json(CONFIG_FILE_NAME, data)
 
+    @cached_property
+    def config_listeners(self) -> list[Callable[[dict, dict], None]]:
+        return []
+
+    def on_config_change(
+        self, callback: Callable[[dict, dict], None]
+    ) -> Callable[[], None]:
+        self.config_listeners.append(callback)
+
+        def remove():
+            if callback in self.config_listeners:
+                self.config_listeners.remove(callback)
+
+        return remove
+
+    def poll_config(self, force: bool = False) -> bool:
+        now = time.monotonic()
+        if not force and now - self._config_polled_at < self.config_poll_interval:
+            return False
+        self._config_polled_at = now
+
+        stamp = self.config_stamp()
+        if self._config is None or stamp == self._config_stamp:
+            return False
+
+        old = self._config
+        try:
+            new = self.read_config()
+        except Exception as exc:
+            # keep the last good config, the file is probably being edited
+            self._config_stamp = stamp
+            self.logger.error(f"Failed to reload config: {exc}")
+            return False
+
+        if new == old:
+            return False
+
+        self.logger.info(f"Config changed: {self.config_file}")
+        for callback in list(self.config_listeners):
+            try:
+                callback(old, dict(new))
+            except Exception:
+                self.logger.exception("Config change listener failed")
+        return True
+
+    def process(self) -> Optional[psutil.Process]:
+        """\
+        Return the process of the pid file if it is still the execution's.
+        A process left the pid file behind when it was killed, and its pid
+        may have been reused since by a process started after the file was
+        written.
+        """
+        if not (pid := self.get_pid()):
+            return None
+        try:
+            proc = psutil.Process(pid)
+            written = os.path.getmtime(self.pid_file)
+            # allow for the coarser resolution of some file systems
+            return proc.create_time() <= written + 1 and proc or None
+        except (psutil.Error, OSError):
+            return None
+
     def stop(self, force: bool = False):
-        if pid := self.get_pid():
-            os.kill(pid, force and signal.SIGKILL or signal.SIGINT)
+        if proc := self.process():
+            os.kill(proc.pid, force and signal.SIGKILL or signal.SIGINT)
+
+    def shutdown(self, timeout: float = 30, force: bool = False) -> str:
+        """\
+        Stop the execution and wait for the process to exit, killing it if
+        it's still alive after ``timeout`` seconds. Return how it ended:
+        "not running", "stale pid", "stopped", "killed" or "alive".
+        """
+        if self.status() not in (
+            ExecutionStatus.running,
+            ExecutionStatus.abnormal_proc,
+        ):
+            return "not running"
+        if not (proc := self.process()):
+            return "stale pid"
+        try:
+            os.kill(proc.pid, force and signal.SIGKILL or signal.SIGINT)
+            if not force and wait_pid(proc.pid, timeout):
+                return "stopped"
+            if not force:
+                # psutil refuses to kill a process that reused the pid meanwhile
+                proc.kill()
+        except (ProcessLookupError, psutil.NoSuchProcess):
+            return "stopped"
+        return wait_pid(proc.pid, 5) and "killed" or "alive"
+
+    def wait_running(self, timeout: float = 30) -> bool:
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if self.status() == ExecutionStatus.running:
+                return True
+            time.sleep(0.1)
+        return False
+
+    def state(
+        self, fields: tuple[str, ...], writable: bool = False
+    ) -> Optional[SharedState]:
+        path = self.file("__state__")
+        if writable:
+            return SharedState.create(path, fields)
+        return SharedState.open(path, fields)
+
+    def usage(self, writable: bool = False, capacity: int = 720) -> SampleRing:
+        path = self.file(USAGE_FILE_NAME)
+        if writable:
+            return SampleRing.create(path, usage_fields, capacity)
+        return SampleRing.open(path, usage_fields)
+
+    def request_profile(self, seconds: float = 10, interval: float = 0.005) -> None:
+        if not (pid := self.get_pid()):
+            raise ExecutionException("The execution is not running")
+        self.write_json(
+            PROFILE_FILE_NAME,
+            {"status": "requested", "seconds": seconds, "interval": interval},
+        )
+        os.kill(pid, signal.SIGUSR1)
 
     def clone(self) -> "Execution":
         return Execution(self.home, self.name)
@@ -277,10 +1122,13 @@ class App(Workspace):
         runner: Callable[[Execution], None],
         name: str = None,
         default_config: dict = None,
+        log_files: list[str] = None,
     ) -> None:
         super().__init__(home, name)
         self.runner = runner
         self.default_config = default_config
+        # files in the execution written by others (stdout, sdk logs), rolled by copy and truncate
+        self.log_files = log_files or ["output.txt"]
 
         if not os.path.isdir(self.home):
             os.makedirs(self.home, exist_ok=True)
@@ -292,7 +1140,8 @@ class App(Workspace):
         return [
             Execution(os.path.join(self.home, d), d)
             for d in os.listdir(self.home)
-            if os.path.isdir(os.path.join(self.home, d))
+            # __name__ directories hold app level data, not executions
+            if os.path.isdir(os.path.join(self.home, d)) and not d.startswith("__")
         ]
 
     def execution_map(self) -> dict[str, Execution]:
@@ -316,10 +1165,70 @@ class App(Workspace):
         if name:
             return es[name]
 
+    def select_executions(
+        self, patterns: list[str] = None, all: bool = False
+    ) -> list[Execution]:
+        """\
+        Executions matching any of the names or glob patterns, all of them
+        with ``all``, otherwise the one picked by ``select_execution``.
+        """
+        if all or any(is_pattern(p) for p in patterns or []):
+            return [
+                e
+                for e in sorted(self.execution_list(), key=lambda e: e.name)
+                if all or any(fnmatch(e.name, p) for p in patterns)
+            ]
+        if len(patterns or []) > 1:
+            es = self.execution_map()
+            for name in patterns:
+                if name not in es:
+                    typer.echo(f"The execution '{name}' does not exist")
+            return [es[name] for name in patterns if name in es]
+        e = self.select_execution(patterns and patterns[0] or None)
+        return e and [e] or []
+
+    def bulk(
+        self, es: list[Execution], action: Callable[[Execution], str]
+    ) -> list[tuple[str, str, float]]:
+        """\
+        Run ``action`` on the executions concurrently, return the name,
+        outcome and seconds taken of each one in order.
+        """
+
+        def timed(e: Execution) -> tuple[str, str, float]:
+            started = time.monotonic()
+            try:
+                outcome = action(e)
+            except Exception as ex:
+                outcome = f"error: {ex}"
+            return e.name, outcome, time.monotonic() - started
+
+        if not es:
+            return []
+        with ThreadPoolExecutor(max_workers=min(len(es), 32)) as pool:
+            return list(pool.map(timed, es))
+
     def execute(self, e: Execution) -> None:
         import atexit
 
         execution_pid = os.getpid()
+        try:
+            config = e.read_config()
+        except Exception:
+            config = {}
+        log_config_error = None
+        try:
+            # a bad value keeps the defaults instead of aborting the start
+            max_bytes = int(config.get("log.max_bytes", 0))
+            backup_count = int(config.get("log.backup_count", 20))
+        except (TypeError, ValueError) as exc:
+            log_config_error = exc
+        else:
+            e.log_max_bytes = max_bytes
+            e.log_backup_count = backup_count
+        e.async_logging = bool(config.get("log.async"))
+        e.log_compression = config.get("log.compression", "gzip")
+
         try:
             # TODO acquire a file lock before update the pid file
             e.set_pid(execution_pid)
@@ -331,9 +1240,37 @@ class App(Workspace):
                 f"Faied to set execution pid {execution_pid} for '{e.name}'"
             )
 
+        if log_config_error:
+            e.logger.warning(
+                f"Invalid log settings, using defaults: {log_config_error}"
+            )
+
         @atexit.register
         def bye():
             e.logger.info(f"Exit {execution_pid}")
+            e.flush_logs()
+
+        if isinstance(handler := e.log_handler, QueueLogHandler):
+            e.metrics.gauge("log_queue_depth", handler.queue.qsize)
+            e.metrics.gauge("log_records_dropped", lambda: handler.dropped)
+
+        if hasattr(signal, "SIGUSR1"):
+            self.install_profiler(e)
+
+        if e.log_max_bytes:
+            self.rotate_logs(e)
+
+        try:
+            if interval := float(config.get("usage.interval", 5)):
+                self.sample_usage(e, interval)
+        except Exception:
+            e.logger.exception("Failed to start usage sampler")
+
+        try:
+            if config.get("metrics.enabled"):
+                self.serve_metrics(e)
+        except Exception:
+            e.logger.exception("Failed to start metrics endpoint")
 
         try:
             self.runner(e)
@@ -341,6 +1278,85 @@ class App(Workspace):
         except Exception as exc:
             e.logger.exception(exc)
 
+    def sample_usage(self, e: Execution, interval: float) -> None:
+        # an hour of samples at the configured interval
+        ring = e.usage(writable=True, capacity=max(int(3600 / interval), 60))
+        proc = psutil.Process()
+        proc.cpu_percent()
+
+        def run():
+            while True:
+                time.sleep(interval)
+                try:
+                    ring.append(sample_usage(proc))
+                except Exception:
+                    e.logger.exception("Failed to sample usage")
+
+        thread = threading.Thread(target=run, name="usage-sampler")
+        thread.daemon = True
+        thread.start()
+
+    def rotate_logs(self, e: Execution, interval: float = 10.0) -> None:
+        rotator = e.log_rotator
+        files = [e.file(f) for f in self.log_files]
+
+        def run():
+            for path in [e.log_file, *files]:
+                rotator.compress_pending(path)
+            while True:
+                for path in files:
+                    if rotator.should_rotate(path):
+                        try:
+                            rotator.rotate(path, copy_truncate=True)
+                        except Exception:
+                            e.logger.exception(f"Failed to roll {path}")
+                time.sleep(interval)
+
+        thread = threading.Thread(target=run, name="log-rotator")
+        thread.daemon = True
+        thread.start()
+
+    def serve_metrics(self, e: Execution) -> None:
+        process_metrics(e.metrics)
+        server = e.metrics.serve()
+        url = f"http://127.0.0.1:{server.server_address[1]}/metrics"
+        e.write_text("__metrics__", url)
+        e.logger.info(f"Metrics endpoint {url}")
+
+    def install_profiler(self, e: Execution) -> None:
+        profiler = SamplingProfiler()
+
+        def done(output: str, samples: int) -> None:
+            e.write_json(
+                PROFILE_FILE_NAME,
+                {"status": "done", "output": output, "samples": samples},
+            )
+            e.logger.info(f"Profile written to {output} ({samples} samples)")
+
+        def toggle(signum, frame) -> None:
+            if profiler.running:
+                profiler.stop()
+                return
+            try:
+                request = e.read_json(PROFILE_FILE_NAME)
+            except Exception:
+                request = {}
+            output = e.file(time.strftime("profile-%Y%m%d-%H%M%S.folded"))
+            seconds = float(request.get("seconds", 10))
+            e.write_json(
+                PROFILE_FILE_NAME,
+                {"status": "running", "output": output, "seconds": seconds},
+            )
+            e.logger.info(f"Profiling for {seconds}s")
+            profiler.start(
+                output,
+                seconds=seconds,
+                interval=float(request.get("interval", 0.005)),
+                on_done=done,
+            )
+
+        signal.signal(signal.SIGUSR1, toggle)
+
     @cached_property
     def cli(self) -> typer.Typer:
         app = typer.Typer()
@@ -405,14 +1421,134 @@ class App(Workspace):
                 typer.echo(f"Config: {e.config_file}")
                 edit_file(e.config_file, open_with)
 
-        @app.command(help=f"Stop execution")
-        def stop(name: Optional[str] = typer.Argument(None), force: bool = False):
+        def report(results: list[tuple[str, str, float]], ok: tuple[str, ...]):
+            for name, outcome, seconds in results:
+                typer.echo(f"{name:<20} {outcome:<12} {seconds:6.2f}s")
+            if any(outcome not in ok for _, outcome, _ in results):
+                raise typer.Exit(1)
+
+        @app.command(help=f"Stop executions, names can be glob patterns")
+        def stop(
+            names: Optional[list[str]] = typer.Argument(None),
+            all: bool = typer.Option(False, "--all", help="Stop all executions"),
+            force: bool = False,
+            wait: bool = typer.Option(True, help="Wait for the processes to exit"),
+            timeout: float = typer.Option(30, help="Kill the process after seconds"),
+        ):
+            es = self.select_executions(names, all)
+            if not wait:
+                for e in es:
+                    if e.status() in (
+                        ExecutionStatus.running,
+                        ExecutionStatus.abnormal_proc,
+                    ):
+                        e.stop(force)
+                return
+            report(
+                self.bulk(es, lambda e: e.shutdown(timeout, force)),
+                ("not running", "stale pid", "stopped", "killed"),
+            )
+
+        @app.command(help=f"Profile running execution, run again to stop early")
+        def profile(
+            name: Optional[str] = typer.Argument(None),
+            seconds: float = 10,
+            interval: float = 0.005,
+            wait: bool = True,
+        ):
+            if not hasattr(signal, "SIGUSR1"):
+                typer.echo("Profiling is not supported on this platform")
+                raise typer.Exit(1)
             if e := self.select_execution(name):
-                if e.status() in (
-                    ExecutionStatus.running,
-                    ExecutionStatus.abnormal_proc,
-                ):
-                    e.stop(force)
+                if e.status() != ExecutionStatus.running:
+                    typer.echo(f"Execution '{e.name}' is not running")
+                    raise typer.Exit(1)
+                try:
+                    stopping = e.read_json(PROFILE_FILE_NAME)["status"] == "running"
+                except Exception:
+                    stopping = False
+                e.request_profile(seconds, interval)
+                if not wait:
+                    return
+                typer.echo(
+                    stopping and "Stopping profiler ..." or f"Profiling {seconds}s ..."
+                )
+                deadline = time.monotonic() + (not stopping and seconds or 0) + 10
+                while time.monotonic() < deadline:
+                    time.sleep(0.2)
+                    try:
+                        result = e.read_json(PROFILE_FILE_NAME)
+                    except Exception:
+                        continue
+                    if result.get("status") == "done":
+                        typer.echo(f"{result['samples']} samples: {result['output']}")
+                        return
+                typer.echo("Timed out waiting for the profile")
+                raise typer.Exit(1)
+
+        def usage_rows(es: list[Execution], window: float) -> list[tuple]:
+            now = time.time()
+            rows = []
+            for e in es:
+                if not (ring := e.usage()):
+                    continue
+                try:
+                    samples = ring.history()
+                finally:
+                    ring.close()
+                if not samples:
+                    continue
+                last = samples[-1]
+                interval = len(samples) > 1 and last["time"] - samples[-2]["time"]
+                # a sampler that stopped writing belongs to an exited process
+                if now - last["time"] > max(3 * (interval or 0), 15):
+                    continue
+                since = [s for s in samples if s["time"] >= last["time"] - window]
+                rows.append(
+                    (
+                        e.name,
+                        int(last["pid"]),
+                        last["cpu_percent"],
+                        last["cpu_seconds"],
+                        last["rss"] / 2**20,
+                        (last["rss"] - since[0]["rss"]) / 2**20,
+                        int(last["fds"]),
+                        int(last["threads"]),
+                    )
+                )
+            return rows
+
+        @app.command(help=f"Show resource usage of running executions")
+        def top(
+            names: Optional[list[str]] = typer.Argument(None),
+            interval: float = typer.Option(2, help="Refresh interval in seconds"),
+            window: float = typer.Option(600, help="Seconds of RSS growth to show"),
+            sort: str = typer.Option("cpu", help="Sort by cpu, rss, growth or name"),
+            once: bool = typer.Option(False, help="Print once and exit"),
+        ):
+            es = self.select_executions(names or ["*"])
+            key = {
+                "name": lambda r: r[0],
+                "cpu": lambda r: -r[2],
+                "rss": lambda r: -r[4],
+                "growth": lambda r: -r[5],
+            }[sort]
+            header = f"{'NAME':<20} {'PID':>7} {'CPU%':>6} {'CPU TIME':>9} {'RSS MB':>8} {'GROWTH':>8} {'FDS':>5} {'THR':>4}"
+            try:
+                while True:
+                    rows = sorted(usage_rows(es, window), key=key)
+                    lines = [time.strftime("%H:%M:%S"), header] + [
+                        f"{n:<20} {pid:>7} {cpu:>6.1f} {secs:>9.1f} {rss:>8.1f} {growth:>+8.1f} {fds:>5} {thr:>4}"
+                        for n, pid, cpu, secs, rss, growth, fds, thr in rows
+                    ]
+                    if not once:
+                        typer.clear()
+                    typer.echo("\n".join(lines))
+                    if once:
+                        return
+                    time.sleep(interval)
+            except KeyboardInterrupt:
+                pass
 
         @app.command(help=f"Remove execution")
         def remove(name: Optional[str] = typer.Argument(None)):
@@ -426,15 +1562,26 @@ class App(Workspace):
             name: Optional[str] = typer.Argument(None),
             file: Optional[str] = typer.Option(None, "-f", help="File name"),
             _print: bool = typer.Option(False, "-p", help="Print to console"),
+            lines: int = typer.Option(0, "-n", help="Print the last N lines"),
+            follow: bool = typer.Option(False, "--follow", help="Follow the log"),
             open_with: str = None,
         ):
             if e := self.select_execution(name):
                 f = file and e.file(file) or e.log_file
-                if _print:
-                    with open(f, "r") as fp:
-                        print(fp.read())
-                else:
-                    edit_file(f, open_with)
+                try:
+                    if lines or follow:
+                        for line in lines and tailer.tail_lines(f, lines) or []:
+                            print(line)
+                        if follow:
+                            for line in tailer.follow_path(f, 0.5):
+                                print(line, flush=True)
+                    elif _print:
+                        for line in tailer.iter_lines(f):
+                            print(line)
+                    else:
+                        edit_file(f, open_with)
+                except KeyboardInterrupt:
+                    pass
 
         @app.command(help=f"New execution")
         def new(
@@ -468,12 +1615,45 @@ class App(Workspace):
             e.write_config(init_config)
             edit_file(e.config_file, open_with)
 
-        @app.command(help=f"Start execution")
-        def start(name: Optional[str] = typer.Argument(None), service: bool = False):
-            if e := self.select_execution(name):
-                if service:
-                    start_execution_daemon(e)
-                else:
-                    self.execute(e)
+        @app.command(help=f"Start execution, names can be glob patterns")
+        def start(
+            names: Optional[list[str]] = typer.Argument(None),
+            all: bool = typer.Option(False, "--all", help="Start all executions"),
+            service: bool = False,
+            timeout: float = typer.Option(30, help="Seconds to wait for the start"),
+        ):
+            # only a single plain name runs in the foreground, a selection
+            # runs in the background even if it matches one execution
+            single = (
+                not all
+                and len(names or []) <= 1
+                and not any(is_pattern(n) for n in names or [])
+            )
+            es = self.select_executions(names, all)
+            if single and not service:
+                if es:
+                    self.execute(es[0])
+                return
+
+            def launch(e: Execution) -> str:
+                if e.status() == ExecutionStatus.running:
+                    return "running"
+                # a stale pid file would look like a started execution
+                if os.path.isfile(e.pid_file):
+                    os.remove(e.pid_file)
+                start_execution_daemon(e)
+                return e.wait_running(timeout) and "started" or "not started"
+
+            report(self.bulk(es, launch), ("running", "started"))
 
         return app
+
+
+def _test():
+    import doctest
+
+    doctest.testmod()
+
+
+if __name__ == "__main__":
+    _test()
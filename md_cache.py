@@ -0,0 +1,326 @@
+import hashlib
+import json
+import mmap
+import os
+import struct
+import zlib
+from abc import ABC, abstractmethod
+from datetime import date, datetime, timedelta, timezone
+
+import numpy as np
+import pandas as pd
+
+# chunk header: magic, version, column count, row count
+HEADER = struct.Struct("<4sHHQ")
+MAGIC = b"QFCK"
+VERSION = 1
+# column directory entry after its name and dtype: offset and length of the block
+BLOCK = struct.Struct("<QQ")
+
+NS_PER_DAY = 86400 * 10**9
+CHINA_OFFSET_NS = 8 * 3600 * 10**9
+EPOCH = date(1970, 1, 1)
+china_tz = timezone(timedelta(hours=8))
+
+
+def kline_kind(duration: int) -> str:
+    return f"kline_{duration}"
+
+
+def calendar_days(start: date, end: date) -> list[date]:
+    return [start + timedelta(days=i) for i in range((end - start).days + 1)]
+
+
+def china_today() -> date:
+    return datetime.now(china_tz).date()
+
+
+def day_numbers(datetimes: np.ndarray) -> np.ndarray:
+    # days since the epoch in Beijing time
+    return (datetimes.astype("int64") + CHINA_OFFSET_NS) // NS_PER_DAY
+
+
+def encode_chunk(df: pd.DataFrame) -> bytes:
+    """\
+    One zlib compressed block per numeric column after a directory of the
+    columns, so a reader decompresses only the columns it asks for.
+    Non-numeric columns (symbol, duration labels) are dropped.
+    """
+    columns = [c for c in df.columns if df[c].dtype.kind in "biuf"]
+    blocks = [zlib.compress(np.ascontiguousarray(df[c].to_numpy()), 6) for c in columns]
+
+    directory = bytearray()
+    for c in columns:
+        name, dtype = str(c).encode(), df[c].dtype.str.encode()
+        directory += struct.pack("<H", len(name)) + name
+        directory += struct.pack("<B", len(dtype)) + dtype
+        directory += BLOCK.pack(0, 0)
+
+    offset = HEADER.size + len(directory)
+    out = bytearray(HEADER.pack(MAGIC, VERSION, len(columns), len(df)))
+    pos = 0
+    for c, block in zip(columns, blocks):
+        name, dtype = str(c).encode(), df[c].dtype.str.encode()
+        pos += 2 + len(name) + 1 + len(dtype)
+        BLOCK.pack_into(directory, pos, offset, len(block))
+        pos += BLOCK.size
+        offset += len(block)
+    out += directory
+    for block in blocks:
+        out += block
+    return bytes(out)
+
+
+def decode_chunk(buf, columns: list[str] = None) -> dict[str, np.ndarray]:
+    magic, version, count, rows = HEADER.unpack_from(buf, 0)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError("Not a market data chunk")
+    view = memoryview(buf)
+    pos = HEADER.size
+    data = {}
+    try:
+        for _ in range(count):
+            (n,) = struct.unpack_from("<H", buf, pos)
+            name = bytes(view[pos + 2 : pos + 2 + n]).decode()
+            pos += 2 + n
+            (n,) = struct.unpack_from("<B", buf, pos)
+            dtype = np.dtype(bytes(view[pos + 1 : pos + 1 + n]).decode())
+            pos += 1 + n
+            offset, length = BLOCK.unpack_from(buf, pos)
+            pos += BLOCK.size
+            if columns is None or name in columns:
+                block = zlib.decompress(view[offset : offset + length])
+                data[name] = np.frombuffer(block, dtype, rows)
+    finally:
+        view.release()
+    return data
+
+
+class DataSource(ABC):
+    @abstractmethod
+    def fetch(self, symbol: str, kind: str, start: date, end: date) -> pd.DataFrame:
+        """\
+        Ticks or klines of the days from ``start`` to ``end`` (inclusive, Beijing
+        time) with a ``datetime`` column in epoch nanoseconds.
+        """
+
+
+class CsvSource(DataSource):
+    """\
+    Local stand-in for the data server, reading ``<symbol>/<kind>.csv`` under
+    ``directory``. Datetimes may be epoch nanoseconds or Beijing time strings.
+    """
+
+    def __init__(self, directory: str) -> None:
+        self.directory = directory
+        self.fetches: list[tuple[str, str, date, date]] = []
+
+    def fetch(self, symbol: str, kind: str, start: date, end: date) -> pd.DataFrame:
+        self.fetches.append((symbol, kind, start, end))
+        df = pd.read_csv(os.path.join(self.directory, symbol, f"{kind}.csv"))
+        if df["datetime"].dtype.kind not in "iu":
+            # Beijing wall time to epoch nanoseconds whatever unit pandas parses to
+            wall = pd.to_datetime(df["datetime"]).to_numpy().astype("datetime64[ns]")
+            df["datetime"] = wall.astype("int64") - CHINA_OFFSET_NS
+        days = day_numbers(df["datetime"].to_numpy())
+        lo, hi = (start - EPOCH).days, (end - EPOCH).days
+        return df[(days >= lo) & (days <= hi)].reset_index(drop=True)
+
+
+class TqSource(DataSource):
+    def __init__(self, api) -> None:
+        self.api = api
+
+    def fetch(self, symbol: str, kind: str, start: date, end: date) -> pd.DataFrame:
+        # naive datetimes are taken as Beijing time by tqsdk
+        start_dt = datetime.combine(start, datetime.min.time())
+        end_dt = datetime.combine(end + timedelta(days=1), datetime.min.time())
+        if kind == "tick":
+            return self.api.get_tick_data_series(symbol, start_dt, end_dt)
+        duration = int(kind.removeprefix("kline_"))
+        return self.api.get_kline_data_series(symbol, duration, start_dt, end_dt)
+
+
+class MarketDataCache:
+    """\
+    Ticks and klines cached per symbol, kind and day under ``home``.
+
+    Each day is stored once as a chunk named by the sha256 of its content in
+    ``objects/``, ``manifest.json`` maps ``symbol/kind/day`` to the chunk. A
+    request fetches only the runs of days missing from the manifest, and days
+    from today on are never cached as they may still change.
+
+    >>> import tempfile
+    >>> root = tempfile.mkdtemp()
+    >>> os.makedirs(os.path.join(root, "csv", "SHFE.cu2205"))
+    >>> hours = pd.date_range("2022-03-01", "2022-03-06 23:00", freq="h")
+    >>> pd.DataFrame({
+    ...     "datetime": hours.strftime("%Y-%m-%d %H:%M:%S"),
+    ...     "close": range(len(hours)),
+    ... }).to_csv(os.path.join(root, "csv", "SHFE.cu2205", "kline_3600.csv"), index=False)
+    >>> source = CsvSource(os.path.join(root, "csv"))
+    >>> cache = MarketDataCache(os.path.join(root, "cache"), source)
+    >>> len(cache.get("SHFE.cu2205", "kline_3600", date(2022, 3, 2), date(2022, 3, 3)))
+    48
+    >>> df = cache.get("SHFE.cu2205", "kline_3600", date(2022, 3, 1), date(2022, 3, 5))
+    >>> df["close"].tolist() == list(range(120))
+    True
+    >>> [(start.day, end.day) for _, _, start, end in source.fetches]
+    [(2, 3), (1, 1), (4, 5)]
+    >>> cache.hits, cache.misses
+    (2, 5)
+    >>> reload = MarketDataCache(os.path.join(root, "cache"), source)
+    >>> len(reload.get("SHFE.cu2205", "kline_3600", date(2022, 3, 1), date(2022, 3, 5)))
+    120
+    >>> len(source.fetches)
+    3
+    """
+
+    def __init__(self, home: str, source: DataSource) -> None:
+        self.home = home
+        self.source = source
+        self.hits = 0
+        self.misses = 0
+        self._manifest: dict = None
+        self._manifest_stamp = None
+        os.makedirs(os.path.join(home, "objects"), exist_ok=True)
+
+    @property
+    def manifest_file(self) -> str:
+        return os.path.join(self.home, "manifest.json")
+
+    def manifest(self) -> dict:
+        try:
+            st = os.stat(self.manifest_file)
+            stamp = st.st_mtime_ns, st.st_size
+        except OSError:
+            stamp = None
+        if self._manifest is None or stamp != self._manifest_stamp:
+            try:
+                with open(self.manifest_file) as fp:
+                    self._manifest = json.load(fp)["partitions"]
+            except (OSError, ValueError, KeyError):
+                self._manifest = {}
+            self._manifest_stamp = stamp
+        return self._manifest
+
+    def save_manifest(self, updates: dict) -> None:
+        # merged into the latest manifest, another process may have added days
+        self._manifest = None
+        partitions = {**self.manifest(), **updates}
+        tmp = f"{self.manifest_file}.{os.getpid()}.tmp"
+        with open(tmp, "w") as fp:
+            json.dump({"version": VERSION, "partitions": partitions}, fp, indent=1)
+        os.replace(tmp, self.manifest_file)
+        self._manifest = None
+
+    @staticmethod
+    def key(symbol: str, kind: str, day: date) -> str:
+        return f"{symbol}/{kind}/{day.isoformat()}"
+
+    def object_path(self, digest: str) -> str:
+        return os.path.join(self.home, "objects", digest[:2], digest)
+
+    def store(self, df: pd.DataFrame) -> str:
+        chunk = encode_chunk(df)
+        digest = hashlib.sha256(chunk).hexdigest()
+        path = self.object_path(digest)
+        if not os.path.isfile(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp = f"{path}.{os.getpid()}.tmp"
+            with open(tmp, "wb") as fp:
+                fp.write(chunk)
+            os.replace(tmp, path)
+        return digest
+
+    def load(self, digest: str, columns: list[str] = None) -> pd.DataFrame:
+        with open(self.object_path(digest), "rb") as fp:
+            with mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                return pd.DataFrame(decode_chunk(mm, columns))
+
+    def missing(self, symbol: str, kind: str, start: date, end: date) -> list[date]:
+        manifest, today = self.manifest(), china_today()
+        return [
+            d
+            for d in calendar_days(start, end)
+            if d >= today or self.key(symbol, kind, d) not in manifest
+        ]
+
+    def get(
+        self,
+        symbol: str,
+        kind: str,
+        start: date,
+        end: date,
+        columns: list[str] = None,
+    ) -> pd.DataFrame:
+        missing = self.missing(symbol, kind, start, end)
+        fetched = self.fetch(symbol, kind, missing)
+        manifest = self.manifest()
+
+        frames = []
+        for d in calendar_days(start, end):
+            if d in fetched:
+                df = fetched[d]
+                frames.append(df[[c for c in columns if c in df]] if columns else df)
+            else:
+                self.hits += 1
+                frames.append(
+                    self.load(manifest[self.key(symbol, kind, d)]["hash"], columns)
+                )
+        frames = [f for f in frames if len(f)]
+        if not frames:
+            return pd.DataFrame(columns=columns or ["datetime"])
+        return pd.concat(frames, ignore_index=True)
+
+    def fetch(
+        self, symbol: str, kind: str, days: list[date]
+    ) -> dict[date, pd.DataFrame]:
+        """Fetch each run of consecutive days with one request and cache past days."""
+        runs: list[list[date]] = []
+        for d in days:
+            if runs and (d - runs[-1][-1]).days == 1:
+                runs[-1].append(d)
+            else:
+                runs.append([d])
+
+        today, fetched, updates = china_today(), {}, {}
+        for run in runs:
+            self.misses += len(run)
+            df = self.source.fetch(symbol, kind, run[0], run[-1])
+            df = df[[c for c in df.columns if df[c].dtype.kind in "biuf"]]
+            numbers = (
+                day_numbers(df["datetime"].to_numpy()) if len(df) else np.array([])
+            )
+            for d in run:
+                part = df[numbers == (d - EPOCH).days].reset_index(drop=True)
+                fetched[d] = part
+                if d < today:
+                    updates[self.key(symbol, kind, d)] = {
+                        "hash": self.store(part),
+                        "rows": len(part),
+                    }
+        if updates:
+            self.save_manifest(updates)
+        return fetched
+
+    def prune(self) -> int:
+        """Remove chunks no longer referenced by the manifest."""
+        used = {p["hash"] for p in self.manifest().values()}
+        removed = 0
+        for folder, _, files in os.walk(os.path.join(self.home, "objects")):
+            for f in files:
+                if f not in used:
+                    os.remove(os.path.join(folder, f))
+                    removed += 1
+        return removed
+
+
+def _test():
+    import doctest
+
+    doctest.testmod()
+
+
+if __name__ == "__main__":
+    _test()
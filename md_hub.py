@@ -0,0 +1,398 @@
+import math
+import mmap
+import os
+import random
+import struct
+import threading
+import time
+from abc import ABC, abstractmethod
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+import psutil
+
+QUOTE_FIELDS = (
+    "datetime",
+    "last_price",
+    "bid_price1",
+    "ask_price1",
+    "bid_volume1",
+    "ask_volume1",
+    "volume",
+    "open_interest",
+    "highest",
+    "lowest",
+)
+
+# header: magic, version, capacity, record size, write sequence
+HEADER = struct.Struct("<4sIIIQ")
+HEADER_SIZE = 64
+MAGIC = b"QFMD"
+VERSION = 1
+# record: sequence number followed by the quote fields
+RECORD = struct.Struct("<Q" + "d" * len(QUOTE_FIELDS))
+WRITE_SEQ_OFFSET = 16
+
+china_tz = timezone(timedelta(hours=8))
+
+
+class QuoteRing:
+    """\
+    Fixed size ring of quotes in a memory-mapped file, one writer and any
+    number of readers in other processes.
+
+    Each slot is guarded by its own sequence number: the writer clears it,
+    writes the fields and then stores the new sequence number, a reader
+    accepts a slot only if it sees the same expected number before and after
+    copying the fields. Neither side takes a lock or makes a syscall.
+    """
+
+    def __init__(self, path: str, mm: mmap.mmap, capacity: int, inode: int) -> None:
+        self.path = path
+        self.mm = mm
+        self.capacity = capacity
+        self.inode = inode
+
+    @classmethod
+    def create(cls, path: str, capacity: int = 4096) -> "QuoteRing":
+        # an existing compatible ring is reused so readers keep their mapping
+        if ring := cls.open(path):
+            if ring.capacity == capacity:
+                return ring
+            ring.close()
+        size = HEADER_SIZE + capacity * RECORD.size
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "wb") as fp:
+            fp.write(HEADER.pack(MAGIC, VERSION, capacity, RECORD.size, 0))
+            fp.truncate(size)
+        os.replace(tmp, path)
+        return cls.open(path)
+
+    @classmethod
+    def open(cls, path: str) -> Optional["QuoteRing"]:
+        try:
+            with open(path, "r+b") as fp:
+                mm = mmap.mmap(fp.fileno(), 0)
+                inode = os.fstat(fp.fileno()).st_ino
+        except (OSError, ValueError):
+            return None
+        magic, version, capacity, record_size, _ = HEADER.unpack_from(mm, 0)
+        if magic != MAGIC or version != VERSION or record_size != RECORD.size:
+            mm.close()
+            return None
+        return cls(path, mm, capacity, inode)
+
+    def close(self) -> None:
+        self.mm.close()
+
+    def replaced(self) -> bool:
+        # create() swaps in a new file when the layout changes
+        try:
+            return os.stat(self.path).st_ino != self.inode
+        except OSError:
+            return True
+
+    @property
+    def write_seq(self) -> int:
+        return struct.unpack_from("<Q", self.mm, WRITE_SEQ_OFFSET)[0]
+
+    def offset(self, seq: int) -> int:
+        return HEADER_SIZE + (seq - 1) % self.capacity * RECORD.size
+
+    def write(self, quote: dict) -> int:
+        seq = self.write_seq + 1
+        offset = self.offset(seq)
+        struct.pack_into("<Q", self.mm, offset, 0)
+        RECORD.pack_into(
+            self.mm,
+            offset,
+            0,
+            *(float(quote.get(f, math.nan)) for f in QUOTE_FIELDS),
+        )
+        struct.pack_into("<Q", self.mm, offset, seq)
+        struct.pack_into("<Q", self.mm, WRITE_SEQ_OFFSET, seq)
+        return seq
+
+    def get(self, seq: int) -> Optional[dict]:
+        offset = self.offset(seq)
+        values = RECORD.unpack_from(self.mm, offset)
+        if values[0] != seq or struct.unpack_from("<Q", self.mm, offset)[0] != seq:
+            # overwritten or being written
+            return None
+        return dict(zip(QUOTE_FIELDS, values[1:]), seq=seq)
+
+    def latest(self) -> Optional[dict]:
+        for _ in range(3):
+            if not (seq := self.write_seq):
+                return None
+            if quote := self.get(seq):
+                return quote
+        return None
+
+    def read(self, after: int) -> tuple[list[dict], int, int]:
+        """\
+        Return the quotes written after sequence ``after``, the sequence to
+        pass next time and how many quotes were lost to overruns.
+        """
+        last = self.write_seq
+        first = max(after + 1, last - self.capacity + 1)
+        lost = first - after - 1
+        quotes = []
+        for seq in range(first, last + 1):
+            if quote := self.get(seq):
+                quotes.append(quote)
+            else:
+                lost += 1
+        return quotes, last, lost
+
+
+class Upstream(ABC):
+    @abstractmethod
+    def subscribe(self, symbol: str) -> None:
+        pass
+
+    @abstractmethod
+    def unsubscribe(self, symbol: str) -> None:
+        pass
+
+    @abstractmethod
+    def poll(self, timeout: float) -> list[tuple[str, dict]]:
+        pass
+
+    def close(self) -> None:
+        pass
+
+
+class SyntheticUpstream(Upstream):
+    """\
+    Local stand-in for the market data server: a random walk per symbol at
+    ``rate`` quotes per second.
+    """
+
+    def __init__(self, rate: float = 10, price: float = 10000, seed: int = None):
+        self.interval = 1 / rate
+        self.start_price = price
+        self.random = random.Random(seed)
+        self.prices: dict[str, float] = {}
+        self.volumes: dict[str, int] = {}
+        self.next_at = time.monotonic()
+
+    def subscribe(self, symbol: str) -> None:
+        self.prices.setdefault(symbol, self.start_price)
+        self.volumes.setdefault(symbol, 0)
+
+    def unsubscribe(self, symbol: str) -> None:
+        self.prices.pop(symbol, None)
+        self.volumes.pop(symbol, None)
+
+    def poll(self, timeout: float) -> list[tuple[str, dict]]:
+        wait = self.next_at - time.monotonic()
+        if wait > timeout:
+            time.sleep(timeout)
+            return []
+        if wait > 0:
+            time.sleep(wait)
+        self.next_at = max(self.next_at + self.interval, time.monotonic())
+
+        updates = []
+        for symbol, price in self.prices.items():
+            price += self.random.choice((-1, 0, 1))
+            self.prices[symbol] = price
+            self.volumes[symbol] += self.random.randint(1, 10)
+            updates.append(
+                (
+                    symbol,
+                    {
+                        "datetime": time.time(),
+                        "last_price": price,
+                        "bid_price1": price - 1,
+                        "ask_price1": price + 1,
+                        "bid_volume1": self.random.randint(1, 50),
+                        "ask_volume1": self.random.randint(1, 50),
+                        "volume": self.volumes[symbol],
+                    },
+                )
+            )
+        return updates
+
+
+def parse_quote_datetime(value: str) -> float:
+    # tqsdk quotes carry the exchange time in Beijing time, "2022-03-01 21:00:00.500000"
+    try:
+        return (
+            datetime.strptime(value, "%Y-%m-%d %H:%M:%S.%f")
+            .replace(tzinfo=china_tz)
+            .timestamp()
+        )
+    except (TypeError, ValueError):
+        return math.nan
+
+
+class TqUpstream(Upstream):
+    def __init__(self, api) -> None:
+        self.api = api
+        self.quotes = {}
+
+    def subscribe(self, symbol: str) -> None:
+        self.quotes[symbol] = self.api.get_quote(symbol)
+
+    def unsubscribe(self, symbol: str) -> None:
+        # tqsdk can't cancel a quote subscription, stop publishing it
+        self.quotes.pop(symbol, None)
+
+    def poll(self, timeout: float) -> list[tuple[str, dict]]:
+        if not self.api.wait_update(deadline=time.time() + timeout):
+            return []
+        updates = []
+        for symbol, quote in self.quotes.items():
+            if self.api.is_changing(quote):
+                q = {f: quote[f] for f in QUOTE_FIELDS if f != "datetime"}
+                q["datetime"] = parse_quote_datetime(quote["datetime"])
+                updates.append((symbol, q))
+        return updates
+
+    def close(self) -> None:
+        self.api.close()
+
+
+def ring_path(directory: str, symbol: str) -> str:
+    return os.path.join(directory, "rings", f"{symbol}.ring")
+
+
+class Hub:
+    """\
+    Holds one upstream subscription per symbol and publishes its quotes to a
+    QuoteRing that every subscriber of the symbol maps. Subscribers register
+    with a ``<symbol>#<pid>`` file, registrations of dead processes are
+    removed and symbols without subscribers are unsubscribed.
+
+    Meant for readers that do not trade. A strategy keeps its own TqApi quote,
+    which TargetPosTask needs to route orders.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        upstream: Upstream,
+        capacity: int = 4096,
+        scan_interval: float = 1.0,
+    ) -> None:
+        self.directory = directory
+        self.upstream = upstream
+        self.capacity = capacity
+        self.scan_interval = scan_interval
+        self.rings: dict[str, QuoteRing] = {}
+        self.published = 0
+        os.makedirs(os.path.join(directory, "rings"), exist_ok=True)
+        os.makedirs(os.path.join(directory, "subscribers"), exist_ok=True)
+
+    def subscriptions(self) -> set[str]:
+        symbols = set()
+        folder = os.path.join(self.directory, "subscribers")
+        for name in os.listdir(folder):
+            symbol, _, pid = name.rpartition("#")
+            if symbol and pid.isdigit() and psutil.pid_exists(int(pid)):
+                symbols.add(symbol)
+            else:
+                try:
+                    os.remove(os.path.join(folder, name))
+                except OSError:
+                    pass
+        return symbols
+
+    def scan(self) -> None:
+        wanted = self.subscriptions()
+        for symbol in wanted - self.rings.keys():
+            self.upstream.subscribe(symbol)
+            self.rings[symbol] = QuoteRing.create(
+                ring_path(self.directory, symbol), self.capacity
+            )
+        for symbol in self.rings.keys() - wanted:
+            self.upstream.unsubscribe(symbol)
+            self.rings.pop(symbol).close()
+
+    def run(self, stop: threading.Event = None) -> None:
+        with open(os.path.join(self.directory, "__pid__"), "w") as fp:
+            fp.write(str(os.getpid()))
+        next_scan = 0
+        try:
+            while not (stop and stop.is_set()):
+                if (now := time.monotonic()) >= next_scan:
+                    self.scan()
+                    next_scan = now + self.scan_interval
+                for symbol, quote in self.upstream.poll(self.scan_interval):
+                    if ring := self.rings.get(symbol):
+                        ring.write(quote)
+                        self.published += 1
+        finally:
+            for ring in self.rings.values():
+                ring.close()
+            self.upstream.close()
+
+
+class Subscriber:
+    # how often an idle subscriber checks whether the hub replaced the ring
+    check_interval = 1.0
+
+    def __init__(self, directory: str, symbol: str) -> None:
+        self.directory = directory
+        self.symbol = symbol
+        self.registration = os.path.join(
+            directory, "subscribers", f"{symbol}#{os.getpid()}"
+        )
+        os.makedirs(os.path.dirname(self.registration), exist_ok=True)
+        open(self.registration, "w").close()
+        self.ring: QuoteRing = None
+        self.seq = 0
+        self.lost = 0
+        self.checked_at = 0
+
+    def attach(self) -> bool:
+        if not self.ring:
+            if ring := QuoteRing.open(ring_path(self.directory, self.symbol)):
+                # only quotes published from now on are read
+                self.ring, self.seq = ring, ring.write_seq
+        return bool(self.ring)
+
+    def reattach(self) -> bool:
+        """\
+        Map the ring again if the hub replaced the file or restarted its
+        sequence, reading the new ring from its oldest quote.
+        """
+        now = time.monotonic()
+        if now - self.checked_at < self.check_interval:
+            return False
+        self.checked_at = now
+        if not (self.ring.replaced() or self.ring.write_seq < self.seq):
+            return False
+        self.ring.close()
+        self.ring = None
+        if not self.attach():
+            return False
+        self.seq = max(self.ring.write_seq - self.ring.capacity, 0)
+        return True
+
+    def latest(self) -> Optional[dict]:
+        if not self.attach():
+            return None
+        self.reattach()
+        return self.ring and self.ring.latest() or None
+
+    def read(self) -> list[dict]:
+        if not self.attach():
+            return []
+        quotes, last, lost = self.ring.read(self.seq)
+        if not quotes and self.reattach():
+            quotes, last, lost = self.ring.read(self.seq)
+        self.seq = last
+        self.lost += lost
+        return quotes
+
+    def close(self) -> None:
+        if self.ring:
+            self.ring.close()
+            self.ring = None
+        try:
+            os.remove(self.registration)
+        except OSError:
+            pass
@@ -0,0 +1,171 @@
+from bisect import bisect_left, bisect_right
+from enum import Enum
+from typing import Any, Iterable, NamedTuple
+
+
+class Cross(str, Enum):
+    above = "above"
+    at_or_above = "at_or_above"
+    below = "below"
+    at_or_below = "at_or_below"
+
+    @property
+    def rising(self) -> bool:
+        return self in (Cross.above, Cross.at_or_above)
+
+    def holds(self, price: float, level: float) -> bool:
+        if self == Cross.above:
+            return price > level
+        if self == Cross.at_or_above:
+            return price >= level
+        if self == Cross.below:
+            return price < level
+        return price <= level
+
+
+class Trigger(NamedTuple):
+    name: str
+    level: float
+    cross: Cross
+    payload: Any = None
+
+
+class TriggerBook:
+    """\
+    Price triggers of one symbol.
+
+    Rising and falling triggers are kept in two lists sorted by level, so an
+    update only bisects into the range between the previous and the current
+    price and returns the triggers whose condition just became true, in the
+    order the price passed them.
+    """
+
+    def __init__(self, triggers: Iterable[Trigger] = ()) -> None:
+        self.rising_levels: list[float] = []
+        self.rising: list[Trigger] = []
+        self.falling_levels: list[float] = []
+        self.falling: list[Trigger] = []
+        self.last_price: float = None
+        for t in triggers:
+            self.add(t)
+
+    def __len__(self) -> int:
+        return len(self.rising) + len(self.falling)
+
+    def _side(self, cross: Cross) -> tuple[list[float], list[Trigger]]:
+        if cross.rising:
+            return self.rising_levels, self.rising
+        return self.falling_levels, self.falling
+
+    def add(self, trigger: Trigger) -> None:
+        trigger = trigger._replace(cross=Cross(trigger.cross))
+        levels, triggers = self._side(trigger.cross)
+        i = bisect_right(levels, trigger.level)
+        levels.insert(i, trigger.level)
+        triggers.insert(i, trigger)
+
+    def remove(self, name: str) -> None:
+        for levels, triggers in (
+            (self.rising_levels, self.rising),
+            (self.falling_levels, self.falling),
+        ):
+            keep = [i for i, t in enumerate(triggers) if t.name != name]
+            levels[:] = [levels[i] for i in keep]
+            triggers[:] = [triggers[i] for i in keep]
+
+    def reset(self) -> None:
+        """\
+        Forget the last price, the next update reports every trigger whose
+        condition holds at that price.
+        """
+        self.last_price = None
+
+    def update(self, price: float) -> list[Trigger]:
+        """\
+        Return the triggers whose condition became true moving from the last
+        price to ``price``. The first update returns every trigger whose
+        condition holds, NaN prices are ignored.
+        >>> book = TriggerBook([
+        ...     Trigger("up", 10, Cross.at_or_above),
+        ...     Trigger("down", 5, Cross.below),
+        ...     Trigger("far", 20, Cross.above),
+        ... ])
+        >>> [t.name for t in book.update(4)]
+        ['down']
+        >>> book.update(float("nan"))
+        []
+        >>> book.update(4)
+        []
+        >>> [t.name for t in book.update(25)]
+        ['up', 'far']
+        >>> [t.name for t in book.update(3)]
+        ['down']
+        >>> book.update(5)
+        []
+        """
+        if price != price:
+            # NaN, no quote yet
+            return []
+
+        prev, self.last_price = self.last_price, price
+
+        if prev is None:
+            rising = self.rising[: bisect_right(self.rising_levels, price)]
+            falling = self.falling[bisect_left(self.falling_levels, price) :]
+            return [t for t in rising if t.cross.holds(price, t.level)] + [
+                t for t in reversed(falling) if t.cross.holds(price, t.level)
+            ]
+
+        if price > prev:
+            lo = bisect_left(self.rising_levels, prev)
+            hi = bisect_right(self.rising_levels, price)
+            candidates = self.rising[lo:hi]
+        elif price < prev:
+            lo = bisect_left(self.falling_levels, price)
+            hi = bisect_right(self.falling_levels, prev)
+            candidates = reversed(self.falling[lo:hi])
+        else:
+            return []
+
+        return [
+            t
+            for t in candidates
+            if t.cross.holds(price, t.level) and not t.cross.holds(prev, t.level)
+        ]
+
+
+class TriggerEngine:
+    def __init__(self) -> None:
+        self.books: dict[str, TriggerBook] = {}
+
+    def book(self, symbol: str) -> TriggerBook:
+        if (book := self.books.get(symbol)) is None:
+            book = self.books[symbol] = TriggerBook()
+        return book
+
+    def add(self, symbol: str, trigger: Trigger) -> None:
+        self.book(symbol).add(trigger)
+
+    def set(self, symbol: str, triggers: Iterable[Trigger]) -> None:
+        self.books[symbol] = TriggerBook(triggers)
+
+    def remove(self, symbol: str, name: str = None) -> None:
+        if name is None:
+            self.books.pop(symbol, None)
+        elif book := self.books.get(symbol):
+            book.remove(name)
+
+    def update(self, symbol: str, price: float) -> list[Trigger]:
+        if book := self.books.get(symbol):
+            return book.update(price)
+        return []
+
+
+def _test():
+    import doctest
+
+    doctest.testmod()
+
+
+if __name__ == "__main__":
+    _test()
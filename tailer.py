@@ -1,6 +1,10 @@
+import gzip
+import io
+import os
 import re
 import sys
 import time
+from collections import deque
 
 if sys.version_info < (3,):
     range = xrange
@@ -10,19 +14,50 @@ class Tailer(object):
     """\
     Implements tailing and heading functionality like GNU tail and head
     commands.
+
+    Works on text files as well as on files opened in binary mode. In binary
+    mode lines are returned as ``bytes`` and never decoded, so callers only
+    pay for decoding the lines they actually use.
     """
 
     line_terminators = ("\r\n", "\n", "\r")
 
-    def __init__(self, file, read_size=1024, end=False):
+    def __init__(self, file, read_size=8192, end=False):
         self.read_size = read_size
         self.file = file
         self.start_pos = self.file.tell()
+        self.binary = isinstance(self.file.read(0), bytes)
+        if self.binary:
+            self.terminators = tuple(t.encode() for t in self.line_terminators)
+        else:
+            self.terminators = self.line_terminators
+        # single character terminators, searched for in bulk with find/rfind
+        self.terminator_chars = tuple(t for t in self.terminators if len(t) == 1)
+        self.crlf = self.binary and b"\r\n" or "\r\n"
+        separator = self.binary and b"|" or "|"
+        self._split = re.compile(separator.join(map(re.escape, self.terminators))).split
         if end:
             self.seek_end()
 
     def splitlines(self, data):
-        return re.split("|".join(self.line_terminators), data)
+        if self.binary and set(self.terminators) == {b"\r\n", b"\n", b"\r"}:
+            # bytes.splitlines splits on exactly these terminators, but unlike
+            # re.split it drops the empty line after a trailing terminator
+            lines = data.splitlines() or [b""]
+            if data[-1:] in self.terminator_chars:
+                lines.append(b"")
+            return lines
+        return self._split(data)
+
+    def strip_terminator(self, line):
+        """\
+        Remove one trailing line terminator.
+        """
+        if self.crlf in self.terminators and line.endswith(self.crlf):
+            return line[:-2]
+        if line[-1:] in self.terminators:
+            return line[:-1]
+        return line
 
     def seek_end(self):
         self.seek(0, 2)
@@ -38,119 +73,178 @@ class Tailer(object):
 
         return len(read_str), read_str
 
+    def find_terminator(self, data, start, end):
+        found = -1
+        for t in self.terminator_chars:
+            i = data.find(t, start, end)
+            if i >= 0:
+                # the next terminator only matters if it comes earlier
+                found = end = i
+        return found
+
+    def rfind_terminator(self, data, start, end):
+        found = -1
+        for t in self.terminator_chars:
+            i = data.rfind(t, start, end)
+            if i >= 0:
+                found = i
+                start = i + 1
+        return found
+
     def seek_line_forward(self):
         """\
         Searches forward from the current file position for a line terminator
         and seeks to the charachter after it.
         """
-        pos = start_pos = self.file.tell()
+        pos = self.file.tell()
 
         bytes_read, read_str = self.read(self.read_size)
 
-        start = 0
-        if bytes_read and read_str[0] in self.line_terminators:
-            # The first charachter is a line terminator, don't count this one
-            start += 1
-
         while bytes_read > 0:
-            # Scan forwards, counting the newlines in this bufferfull
-            i = start
-            while i < bytes_read:
-                if read_str[i] in self.line_terminators:
-                    self.seek(pos + i + 1)
-                    return self.file.tell()
-                i += 1
-
-            pos += self.read_size
-            self.seek(pos)
-
+            i = self.find_terminator(read_str, 0, bytes_read)
+            if i >= 0:
+                end = pos + i + 1
+                if read_str[i : i + 1] + self._peek(read_str, i + 1) == self.crlf:
+                    # step over the whole crlf
+                    end += 1
+                self.seek(end)
+                return self.file.tell()
+
+            pos += bytes_read
             bytes_read, read_str = self.read(self.read_size)
 
         return None
 
+    def _peek(self, read_str, i):
+        if i < len(read_str):
+            return read_str[i : i + 1]
+        return self.file.read(1)
+
     def seek_line(self):
         """\
         Searches backwards from the current file position for a line terminator
         and seeks to the charachter after it.
         """
-        pos = end_pos = self.file.tell()
-
-        read_size = self.read_size
-        if pos > read_size:
-            pos -= read_size
-        else:
-            pos = 0
-            read_size = end_pos
-
-        self.seek(pos)
-
-        bytes_read, read_str = self.read(read_size)
-
-        if bytes_read and read_str[-1] in self.line_terminators:
-            # The last charachter is a line terminator, don't count this one
-            bytes_read -= 1
-
-            if read_str[-2:] == "\r\n" and "\r\n" in self.line_terminators:
-                # found crlf
-                bytes_read -= 1
-
-        while bytes_read > 0:
-            # Scan backward, counting the newlines in this bufferfull
-            i = bytes_read - 1
-            while i >= 0:
-                if read_str[i] in self.line_terminators:
-                    self.seek(pos + i + 1)
-                    return self.file.tell()
-                i -= 1
-
-            if pos == 0 or pos - self.read_size < 0:
-                # Not enought lines in the buffer, send the whole file
-                self.seek(0)
-                return None
-
-            pos -= self.read_size
+        end = end_pos = self.file.tell()
+
+        # The terminator of the current line doesn't count
+        self.seek(max(0, end_pos - 2))
+        last = self.file.read(end_pos - max(0, end_pos - 2))
+        if last.endswith(self.crlf) and self.crlf in self.terminators:
+            end -= 2
+        elif last[-1:] in self.terminators:
+            end -= 1
+
+        while end > 0:
+            # Scan backward, a bufferfull at a time
+            pos = max(0, end - self.read_size)
             self.seek(pos)
-
-            bytes_read, read_str = self.read(self.read_size)
-
+            bytes_read, read_str = self.read(end - pos)
+            i = self.rfind_terminator(read_str, 0, bytes_read)
+            if i >= 0:
+                self.seek(pos + i + 1)
+                return self.file.tell()
+            end = pos
+
+        # Not enought lines in the buffer, send the whole file
+        self.seek(0)
         return None
 
-    def tail(self, lines=10):
+    def reverse_lines(self):
         """\
-        Return the last lines of the file.
+        Iterator generator that returns lines from the end of the file
+        backwards. The file is read lazily one block of ``read_size`` at a
+        time, so memory is bounded by the block size and the longest line,
+        and the caller can stop as soon as it has found what it needs.
         """
         self.seek_end()
-        end_pos = self.file.tell()
+        end = self.file.tell()
+        pending = None
+        newline = self.binary and b"\n" or "\n"
 
-        for i in range(lines):
-            if not self.seek_line():
-                break
+        while end > 0:
+            pos = max(0, end - self.read_size)
+            self.seek(pos)
+            block = self.file.read(end - pos)
+            if pos > 0 and block[:1] == newline and self.crlf in self.terminators:
+                self.seek(pos - 1)
+                before = self.file.read(1)
+                if before + newline == self.crlf:
+                    # keep a crlf split by the block boundary together
+                    pos -= 1
+                    block = before + block
+
+            if pending is None:
+                # The terminator of the last line doesn't count
+                block = self.strip_terminator(block)
+            else:
+                block += pending
 
-        data = self.file.read(end_pos - self.file.tell() - 1)
-        if data:
-            return self.splitlines(data)
-        else:
-            return []
+            lines = self.splitlines(block)
+            # the first line may continue in the previous block
+            pending = lines.pop(0) if pos > 0 else None
+            for line in reversed(lines):
+                yield line
+            end = pos
 
-    def head(self, lines=10):
+    def forward_lines(self):
         """\
-        Return the top lines of the file.
+        Iterator generator that returns lines from the top of the file. The
+        file is read one block of ``read_size`` at a time and the partial
+        last line of a block is carried over to the next one.
         """
         self.seek(0)
+        pending = None
+        cr = self.binary and b"\r" or "\r"
 
-        for i in range(lines):
-            if not self.seek_line_forward():
+        while True:
+            block = self.file.read(self.read_size)
+            if not block:
                 break
+            while block[-1:] == cr and self.crlf in self.terminators:
+                # keep a crlf split by the block boundary together
+                more = self.file.read(1)
+                if not more:
+                    break
+                block += more
+            if pending:
+                block = pending + block
+
+            lines = self.splitlines(block)
+            # the last line may continue in the next block
+            pending = lines.pop()
+            for line in lines:
+                yield line
 
-        end_pos = self.file.tell()
+        if pending:
+            yield pending
 
-        self.seek(0)
-        data = self.file.read(end_pos - 1)
+    def tail(self, lines=10):
+        """\
+        Return the last lines of the file.
+        """
+        if lines <= 0:
+            return []
+        result = []
+        for line in self.reverse_lines():
+            result.append(line)
+            if len(result) >= lines:
+                break
+        result.reverse()
+        return result
 
-        if data:
-            return self.splitlines(data)
-        else:
+    def head(self, lines=10):
+        """\
+        Return the top lines of the file.
+        """
+        if lines <= 0:
             return []
+        result = []
+        for line in self.forward_lines():
+            result.append(line)
+            if len(result) >= lines:
+                break
+        return result
 
     def follow(self, delay=1.0):
         """\
@@ -163,20 +257,14 @@ class Tailer(object):
             where = self.file.tell()
             line = self.file.readline()
             if line:
-                if trailing and line in self.line_terminators:
+                if trailing and line in self.terminators:
                     # This is just the line terminator added to the end of the file
                     # before a new line, ignore.
                     trailing = False
                     continue
 
-                if line[-1] in self.line_terminators:
-                    line = line[:-1]
-                    if line[-1:] == "\r\n" and "\r\n" in self.line_terminators:
-                        # found crlf
-                        line = line[:-1]
-
                 trailing = False
-                yield line
+                yield self.strip_terminator(line)
             else:
                 trailing = True
                 self.seek(where)
@@ -205,6 +293,34 @@ def tail(file, lines=10):
     return Tailer(file).tail(lines)
 
 
+def reverse_lines(file):
+    """\
+    Iterator generator that returns the lines of the file from the end.
+    >>> try:
+    ...    from StringIO import StringIO
+    ... except ImportError:
+    ...    from io import StringIO
+    >>> f = StringIO()
+    >>> for i in range(11):
+    ...     _ = f.write('Line %d\\n' % (i + 1))
+    >>> lines = reverse_lines(f)
+    >>> next(lines), next(lines)
+    ('Line 11', 'Line 10')
+    """
+    return Tailer(file).reverse_lines()
+
+
+def forward_lines(file):
+    """\
+    Iterator generator that returns the lines of the file from the top.
+    >>> from io import BytesIO
+    >>> f = BytesIO(b'Line 1\\r\\nLine 2\\r\\n\\r\\nLine 4')
+    >>> list(Tailer(f, read_size=8).forward_lines())
+    [b'Line 1', b'Line 2', b'', b'Line 4']
+    """
+    return Tailer(file).forward_lines()
+
+
 def head(file, lines=10):
     """\
     Return the top lines of the file.
@@ -243,6 +359,171 @@ def follow(file, delay=1.0):
     return Tailer(file, end=True).follow(delay)
 
 
+def _segment_pattern(path):
+    return re.compile(re.escape(os.path.basename(path)) + r"\.(\d+)(\.gz|\.zst)?$")
+
+
+def segment_number(segment):
+    """\
+    Return the sequence number of a rolled segment like ``log.txt.000012.gz``.
+    """
+    return int(
+        os.path.basename(segment).split(".")[-2 if _is_compressed(segment) else -1]
+    )
+
+
+def _is_compressed(segment):
+    return segment.endswith(".gz") or segment.endswith(".zst")
+
+
+def log_segments(path):
+    """\
+    Return the rolled segments of ``path``, oldest first. A segment is either
+    still plain or already compressed with gzip or zstd.
+    """
+    directory = os.path.dirname(path) or "."
+    pattern = _segment_pattern(path)
+    found = {}
+    try:
+        names = os.listdir(directory)
+    except OSError:
+        return []
+    for name in names:
+        m = pattern.match(name)
+        if not m:
+            continue
+        number = int(m.group(1))
+        # while a segment is being compressed both copies are complete,
+        # prefer the compressed one which is never removed by the compressor
+        if number not in found or m.group(2):
+            found[number] = os.path.join(directory, name)
+    return [found[n] for n in sorted(found)]
+
+
+def open_segment(segment, mode="r"):
+    """\
+    Open a segment for reading, decompressing it on the fly.
+    """
+    binary = "b" in mode
+    if segment.endswith(".gz"):
+        fp = gzip.open(segment, "rb")
+    elif segment.endswith(".zst"):
+        import zstandard
+
+        fp = zstandard.ZstdDecompressor().stream_reader(
+            open(segment, "rb"), closefd=True
+        )
+    else:
+        fp = open(segment, "rb")
+    if binary:
+        return fp
+    return io.TextIOWrapper(fp, errors="replace")
+
+
+def _strip(line):
+    return line.rstrip("\r\n")
+
+
+def tail_lines(path, lines=10, encoding="utf-8"):
+    """\
+    Return the last lines of ``path`` and its rolled segments read as one
+    stream. Older segments are only decompressed when the newer ones do not
+    hold enough lines. Only the returned lines are decoded, with ``encoding``,
+    or they are returned as bytes when it is None.
+    """
+    result = []
+    if os.path.exists(path):
+        with open(path, "rb") as fp:
+            result = Tailer(fp).tail(lines)
+
+    for segment in reversed(log_segments(path)):
+        if len(result) >= lines:
+            break
+        with open_segment(segment, "rb") as fp:
+            older = (line.rstrip(b"\r\n") for line in fp)
+            result = list(deque(older, lines - len(result))) + result
+
+    result = result[-lines:]
+    if encoding:
+        return [line.decode(encoding, "replace") for line in result]
+    return result
+
+
+def head_lines(path, lines=10):
+    """\
+    Return the first lines of ``path`` and its rolled segments read as one
+    stream, decompressing segments only until enough lines are found.
+    """
+    result = []
+    for line in iter_lines(path):
+        if len(result) >= lines:
+            break
+        result.append(line)
+    return result
+
+
+def iter_lines(path):
+    """\
+    Iterate over all lines of the rolled segments of ``path`` and then the
+    live file, oldest first.
+    """
+    for segment in log_segments(path):
+        try:
+            fp = open_segment(segment)
+        except FileNotFoundError:
+            # removed by the pruning of old segments
+            continue
+        with fp:
+            for line in fp:
+                yield _strip(line)
+
+    if os.path.exists(path):
+        with open(path, "r", errors="replace") as fp:
+            for line in fp:
+                yield _strip(line)
+
+
+def follow_path(path, delay=1.0):
+    """\
+    Follow ``path`` like ``tail -F``: the file is reopened when it has been
+    rolled (renamed or truncated).
+    """
+    fp = None
+    pending = ""
+    at_end = True
+    while True:
+        if fp is None:
+            try:
+                fp = open(path, "r", errors="replace")
+                inode = os.fstat(fp.fileno()).st_ino
+            except FileNotFoundError:
+                time.sleep(delay)
+                continue
+            if at_end:
+                # start from the end the first time, from the top after a roll
+                fp.seek(0, 2)
+                at_end = False
+
+        line = fp.readline()
+        if line:
+            if line.endswith("\n"):
+                yield _strip(pending + line)
+                pending = ""
+            else:
+                pending += line
+            continue
+
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            st = None
+        if st is None or st.st_ino != inode or st.st_size < fp.tell():
+            fp.close()
+            fp = None
+            continue
+        time.sleep(delay)
+
+
 def _test():
     import doctest
 
@@ -251,6 +532,8 @@ def _test():
 
 def _main(filepath, options):
     tailer = Tailer(open(filepath, "rb"))
+    # lines are forwarded as they are, without decoding
+    out = sys.stdout.buffer
 
     try:
         try:
@@ -264,14 +547,16 @@ def _main(filepath, options):
                     lines = tailer.tail(options.lines)
 
                 for line in lines:
-                    print(line)
+                    out.write(line + b"\n")
+                out.flush()
             elif options.follow:
                 # Seek to the end so we can follow
                 tailer.seek_end()
 
             if options.follow:
                 for line in tailer.follow(delay=options.sleep):
-                    print(line)
+                    out.write(line + b"\n")
+                    out.flush()
         except KeyboardInterrupt:
             # Escape silently
             pass
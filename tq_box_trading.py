@@ -1,11 +1,15 @@
 import asyncio
 from asyncio.log import logger
 from contextlib import closing
+from enum import Enum
 import math
 import os
+import signal
 import time
 import traceback
+from typing import Callable, Optional
 import execution_manager as em
+from price_triggers import Cross, Trigger, TriggerEngine
 from tabulate import tabulate
 import typer
 
@@ -44,8 +48,31 @@ config_schema = {
     "tel.bot": "",
     "tel.channel": "1686949643",
     "desktop.notification": False,
+    "retry.backoff": 180,
+    "metrics.enabled": False,
+    "log.async": False,
+    "log.max_bytes": 0,
+    "log.backup_count": 20,
+    "log.compression": "gzip",
+    "tq.debug": "file",
+    # ring 模式下内存中保留的调试日志大小(MB), 按字符计, 常驻内存约为该值的 1-2 倍
+    "tq.debug.ring_mb": 32,
+    "usage.interval": 5,
+    "md.conflate": True,
+    "md.lag_alert_ms": 3000,
+    "md.lag_alert_interval": 300,
 }
 
+# 策略运行必须的配置项
+required_config = (
+    "contract.name",
+    "resistance",
+    "support",
+    "budget",
+    "tq.username",
+    "tq.password",
+)
+
 
 def today_target(total_pos: int, current_pos: int, steps: int) -> int:
     quo, rem = total_pos // steps, total_pos % steps
@@ -79,9 +106,46 @@ def get_notifier(e: em.Execution) -> em.Notifier:
             logger=e.logger, telegram=telegram, desktop=desktop, title=f"震荡策略{symbol}"
         )
         _notifier.start()
+        e.metrics.gauge("notifier_queue_depth", _notifier.queue.qsize)
     return _notifier
 
 
+_gui_port = None
+_debug_ring = None
+
+
+def setup_debug(e: em.Execution, config: dict):
+    """\
+    tq.debug: file 调试日志直接写入 tq-debug.txt; ring 保存在内存中, 出错, 平仓或收到信号时
+    才写入 tq-debug.txt; off 不记录
+    """
+    import logging
+    from shinny_structlog import JSONFormatter
+
+    global _debug_ring
+    mode = config.get("tq.debug", "file")
+    if mode == "file":
+        return e.file("tq-debug.txt")
+
+    tq_logger = logging.getLogger("TqApi")
+    # 避免调试日志经由根日志写到 output.txt
+    tq_logger.propagate = False
+    if mode == "ring" and not _debug_ring:
+        _debug_ring = em.RingBufferHandler(
+            int(float(config.get("tq.debug.ring_mb", 32)) * (1 << 20))
+        )
+        _debug_ring.setFormatter(JSONFormatter())
+        tq_logger.addHandler(_debug_ring)
+    # 已有 handler 或 debug=False 时 TqApi 不会再添加自己的日志文件
+    return False
+
+
+def dump_debug(e: em.Execution, reason: str):
+    if _debug_ring:
+        count = _debug_ring.dump(e.file("tq-debug.txt"))
+        e.logger.info(f"Dumped {count} debug records ({reason})")
+
+
 def get_api(e: em.Execution):
     from tqsdk import (
         TqApi,
@@ -109,33 +173,128 @@ def get_api(e: em.Execution):
     else:
         broker_account = TqSim()
 
-    port = em.get_free_port()
-    e.write_text("__gui__", f"http://127.0.0.1:{port}")
+    # 重连时沿用原来的监控端口, 避免监控地址变化
+    global _gui_port
+    if not (_gui_port and em.port_available(_gui_port)):
+        _gui_port = em.get_free_port()
+        e.write_text("__gui__", f"http://127.0.0.1:{_gui_port}")
+    port = _gui_port
     return TqApi(
         account=broker_account,
         auth=auth,
         web_gui=f":{port}",
-        debug=e.file("tq-debug.txt"),
+        debug=setup_debug(e, config),
     )
 
 
 _strategy_exiting = False
 
 
-def strategy(e: em.Execution):
+def box_params(config: dict) -> dict:
+    """\
+    按 config_schema 校验配置, 计算箱体参数. 配置不合法时抛出 ValueError.
+    >>> config = dict.fromkeys(required_config, "")
+    >>> box_params({**config, "resistance": 1200, "support": 1000, "budget": 100000})
+    {'resistance': 1200, 'support': 1000, 'budget': 100000, 'buy_range': [990.0, 1010.0], 'stop_loss': 985.0}
+    >>> box_params({**config, "resistance": 1005, "support": 1000, "budget": 100000})
+    Traceback (most recent call last):
+    ...
+    ValueError: 阻力位1005必须不低于入场区间上沿1010.0
+    """
+    if missing := [k for k in required_config if k not in config]:
+        raise ValueError(f"缺少配置项: {', '.join(missing)}")
+    for k, default in config_schema.items():
+        if isinstance(default, bool) and not isinstance(config.get(k, default), bool):
+            raise ValueError(f"配置项{k}必须是true或false")
+    try:
+        resistance = int(config["resistance"])
+        support = int(config["support"])
+        budget = int(config["budget"])
+    except (TypeError, ValueError):
+        raise ValueError("阻力位, 支撑位, 本金必须是整数")
+    if not 0 < support < resistance:
+        raise ValueError(f"支撑位{support}必须大于0且低于阻力位{resistance}")
+    buy_range = [support * 0.99, support * 1.01]
+    # 阻力位落在入场区间内时, 同一价格既要加仓又要止盈
+    if resistance < buy_range[1]:
+        raise ValueError(f"阻力位{resistance}必须不低于入场区间上沿{buy_range[1]}")
+
+    return {
+        "resistance": resistance,
+        "support": support,
+        "budget": budget,
+        "buy_range": buy_range,
+        "stop_loss": support * 0.985,
+    }
+
+
+def box_triggers(params: dict) -> list[Trigger]:
+    """\
+    箱体规则: 入场区间的上下沿各用一对触发器记录价格在哪一侧, 两侧都满足即在区间内
+    """
+    low, high = params["buy_range"]
+    return [
+        Trigger("buy_range.low", low, Cross.above, True),
+        Trigger("buy_range.low", low, Cross.at_or_below, False),
+        Trigger("buy_range.high", high, Cross.below, True),
+        Trigger("buy_range.high", high, Cross.at_or_above, False),
+        Trigger("stop_loss", params["stop_loss"], Cross.at_or_below, "平仓止损"),
+        Trigger("take_profit", params["resistance"], Cross.at_or_above, "平仓止盈"),
+    ]
+
+
+def box_signal(fired: list[Trigger], in_range: dict) -> Optional[str]:
+    """\
+    根据本次触发的规则更新入场区间状态, 返回 "平仓止损", "平仓止盈", "加仓" 或 None
+    >>> from price_triggers import TriggerBook
+    >>> book = TriggerBook(box_triggers({
+    ...     "resistance": 1200, "buy_range": [990.0, 1010.0], "stop_loss": 985.0,
+    ... }))
+    >>> in_range = {"buy_range.low": False, "buy_range.high": False}
+    >>> [box_signal(book.update(p), in_range) for p in (1100, 1000, 1005, 1050)]
+    [None, '加仓', '加仓', None]
+    >>> box_signal(book.update(float("nan")), in_range)
+    >>> [box_signal(book.update(p), in_range) for p in (995, 980)]
+    ['加仓', '平仓止损']
+    >>> book.reset()
+    >>> box_signal(book.update(1300), in_range)
+    '平仓止盈'
+    """
+    exit_reason = None
+    for t in fired:
+        if t.name in in_range:
+            in_range[t.name] = t.payload
+        else:
+            exit_reason = t.payload
+    if exit_reason:
+        return exit_reason
+    if all(in_range.values()):
+        return "加仓"
+    return None
+
+
+# 策略运行状态, 每次循环写入共享内存, list 命令直接读取
+state_fields = (
+    "last_price",
+    "pos_long",
+    "today_target",
+    "total_target",
+    "updated_at",
+    "iterations",
+)
+
+
+def strategy(e: em.Execution, on_ready: Callable[[], None] = None):
     global _strategy_exiting
     from tqsdk import TargetPosTask
+    from md_hub import parse_quote_datetime
 
     noti = get_notifier(e)
     api = get_api(e)
 
     config = e.read_config()
     symbol = config["contract.name"]
-    resistance = int(config["resistance"])
-    support = int(config["support"])
-    budget = int(config["budget"])
-    buy_range = [support * 0.99, support * 1.01]
-    stop_loss = support * 0.985
+    params = box_params(config)
 
     # 上交所黄金不能使用市价单
     # pos_task = TargetPosTask(
@@ -149,70 +308,250 @@ def strategy(e: em.Execution):
     with closing(api):
         position = api.get_position(symbol)
         quote = api.get_quote(symbol)
-        total_target_pos = round(budget * 0.2 / (support * quote.volume_multiple * 0.1))
+        if on_ready:
+            on_ready()
+
+        def target_pos(p: dict) -> int:
+            return round(
+                p["budget"] * 0.2 / (p["support"] * quote.volume_multiple * 0.1)
+            )
+
+        total_target_pos = target_pos(params)
         notified_target = None
+        e.metrics.set("position_long", position.pos_long)
+
+        triggers = TriggerEngine()
+        triggers.set(symbol, box_triggers(params))
+        in_range = {"buy_range.low": False, "buy_range.high": False}
+
+        def reload_params(old: dict, new: dict):
+            nonlocal params, total_target_pos, notified_target
+            if new.get("contract.name") != symbol:
+                # 新参数是为另一个合约设定的, 不能用在当前合约上
+                noti.send(
+                    f"{time_str()} 合约变更需要重启策略后生效, 继续使用原参数\n{new.get('contract.name')}"
+                )
+                return
+            try:
+                new_params = box_params(new)
+            except ValueError as exc:
+                noti.send(f"{time_str()} 新配置无效, 继续使用原参数\n{exc}")
+                return
+            if new_params == params:
+                return
+            params = new_params
+            total_target_pos = target_pos(params)
+            notified_target = None
+            # 新的触发器会在下一个价格上重新评估所有规则
+            triggers.set(symbol, box_triggers(params))
+            noti.send(
+                f"{time_str()} 参数更新\n总资金:{params['budget']}\n入场价:{params['buy_range']}\n止盈价:{params['resistance']}\n止损价:{params['stop_loss']}\n总目标仓位:{total_target_pos}手"
+            )
 
         def close_position():
             while position.pos_long != 0:
                 pos_task.set_target_volume(0)
                 api.wait_update()
             noti.send(f"{time_str()} 平仓结束\n策略退出")
+            dump_debug(e, "close position")
 
         if _strategy_exiting:
             close_position()
             return
 
         noti.send(
-            f"{time_str()} 策略启动\n总资金:{budget}\n入场价:{buy_range}\n止盈价:{resistance}\n止损价:{stop_loss}\n总目标仓位:{total_target_pos}手\n昨仓:{position.pos_long_his}手\n今仓:{position.pos_long_today}手"
+            f"{time_str()} 策略启动\n总资金:{params['budget']}\n入场价:{params['buy_range']}\n止盈价:{params['resistance']}\n止损价:{params['stop_loss']}\n总目标仓位:{total_target_pos}手\n昨仓:{position.pos_long_his}手\n今仓:{position.pos_long_today}手"
         )
-        while True:
-            api.wait_update()
+        metrics = e.metrics
+        metrics.rate("loop_iterations_total")
+        metrics.rate("ticks_total")
+        # 落后时合并积压的行情, 只按最新价格决策
+        conflate = config.get("md.conflate", True)
+        lag_alert = float(config.get("md.lag_alert_ms", 3000)) / 1000
+        lag_alert_interval = float(config.get("md.lag_alert_interval", 300))
+        lag_alerted_at = 0
+        first_tick = True
+
+        def check_lag():
+            nonlocal lag_alerted_at, first_tick
+            lag = time.time() - parse_quote_datetime(quote.datetime)
+            if first_tick or lag != lag:
+                # 连接后的第一笔是历史快照, 不计延迟
+                first_tick = False
+                return
+            metrics.set("quote_lag_seconds", lag)
+            now = time.monotonic()
+            if (
+                lag_alert
+                and lag > lag_alert
+                and now - lag_alerted_at > lag_alert_interval
+            ):
+                lag_alerted_at = now
+                noti.send(f"{time_str()} 行情延迟{lag:.1f}秒\n最新价:{quote.last_price}")
+
+        remove_listener = e.on_config_change(reload_params)
+        state = e.state(state_fields, writable=True)
+        iterations = 0
+        try:
+            while True:
+                api.wait_update()
+                quote_changed = api.is_changing(quote, "last_price")
+                position_changed = api.is_changing(position, "pos_long")
+                if conflate:
+                    while api.wait_update(deadline=time.time()):
+                        metrics.inc("conflated_updates_total")
+                        quote_changed |= api.is_changing(quote, "last_price")
+                        position_changed |= api.is_changing(position, "pos_long")
+                metrics.inc("loop_iterations_total")
+                e.poll_config()
+
+                today_target_pos = today_target(
+                    total_target_pos, position.pos_long_his, 5
+                )
+                iterations += 1
+                state.update(
+                    last_price=quote.last_price,
+                    pos_long=position.pos_long,
+                    today_target=today_target_pos,
+                    total_target=total_target_pos,
+                    updated_at=time.time(),
+                    iterations=iterations,
+                )
 
-            today_target_pos = today_target(total_target_pos, position.pos_long_his, 5)
+                if quote_changed:
+                    check_lag()
+                    metrics.inc("ticks_total")
+                    metrics.set("last_price", quote.last_price)
+                    action = box_signal(
+                        triggers.update(symbol, quote.last_price), in_range
+                    )
 
-            if api.is_changing(quote, "last_price"):
-                if quote.last_price > buy_range[0] and quote.last_price < buy_range[1]:
-                    pos_task.set_target_volume(today_target_pos)
-                    if notified_target != today_target_pos:
-                        notified_target = today_target_pos
+                    if action in ("平仓止损", "平仓止盈"):
+                        pos_task.set_target_volume(0)
                         noti.send(
-                            f"{time_str()} 加仓\n总目标仓位:{total_target_pos}手\n已有仓位:{position.pos_long}手\n今日仓位目标:{today_target_pos}手"
+                            f"{time_str()}\n{action}\n总目标仓位:{total_target_pos}手\n已有仓位:{position.pos_long}手\n今日仓位目标:0手"
                         )
-                elif quote.last_price <= stop_loss:
-                    pos_task.set_target_volume(0)
-                    noti.send(
-                        f"{time_str()}\n平仓止损\n总目标仓位:{total_target_pos}手\n已有仓位:{position.pos_long}手\n今日仓位目标:0手"
-                    )
-                    break
-                elif quote.last_price >= resistance:
-                    pos_task.set_target_volume(0)
+                        break
+                    elif action == "加仓":
+                        pos_task.set_target_volume(today_target_pos)
+                        if notified_target != today_target_pos:
+                            notified_target = today_target_pos
+                            noti.send(
+                                f"{time_str()} 加仓\n总目标仓位:{total_target_pos}手\n已有仓位:{position.pos_long}手\n今日仓位目标:{today_target_pos}手"
+                            )
+
+                if position_changed:
+                    metrics.set("position_long", position.pos_long)
                     noti.send(
-                        f"{time_str()}\n平仓止盈\n总目标仓位:{total_target_pos}手\n已有仓位:{position.pos_long}手\n今日仓位目标:0手"
+                        f"{time_str()} 仓位变动\n总目标仓位:{total_target_pos}手\n已有仓位:{position.pos_long}手\n今日仓位目标:{today_target_pos}手"
                     )
-                    break
-
-            if api.is_changing(position, "pos_long"):
-                noti.send(
-                    f"{time_str()} 仓位变动\n总目标仓位:{total_target_pos}手\n已有仓位:{position.pos_long}手\n今日仓位目标:{today_target_pos}手"
-                )
+        finally:
+            remove_listener()
+            state.close()
 
         close_position()
 
 
+class ErrorKind(str, Enum):
+    network = "network"
+    config = "config"
+    other = "other"
+
+
+def classify_error(exc: Exception) -> ErrorKind:
+    from tqsdk.exceptions import TqTimeoutError
+
+    name = type(exc).__name__
+    if (
+        isinstance(exc, (OSError, asyncio.TimeoutError, TqTimeoutError))
+        or "Connection" in name
+        or "Timeout" in name
+    ):
+        return ErrorKind.network
+    if isinstance(exc, (KeyError, ValueError, TypeError)):
+        return ErrorKind.config
+    return ErrorKind.other
+
+
+# 策略连续运行超过这个时间(秒)后出错, 重连间隔从头计算
+retry_stable_seconds = 60
+
+
 def strategy_with_retry(e: em.Execution):
-    backoff = int(e.read_config().get("retry.backoff", 3 * 60))
     noti = get_notifier(e)
+    backoffs = {
+        ErrorKind.network: em.Backoff(base=0.05),
+        ErrorKind.config: em.Backoff(base=5),
+        ErrorKind.other: em.Backoff(base=1),
+    }
+    outage = None
+
+    if hasattr(signal, "SIGUSR2"):
+        signal.signal(signal.SIGUSR2, lambda signum, frame: dump_debug(e, "signal"))
+
+    def on_ready():
+        nonlocal outage
+        if outage is None:
+            return
+        downtime = time.monotonic() - outage["failed_at"]
+        e.metrics.inc("reconnects_total")
+        e.metrics.set("last_reconnect_seconds", downtime)
+        e.logger.info(
+            f"Reconnected after {downtime:.3f}s, {outage['attempts']} attempts ({outage['kind']})"
+        )
+        try:
+            e.db["reconnects"].insert(
+                {
+                    "time": time_str(),
+                    "kind": outage["kind"],
+                    "error": outage["error"],
+                    "attempts": outage["attempts"],
+                    "downtime": downtime,
+                }
+            )
+        except Exception:
+            e.logger.exception("Failed to record reconnect")
+        noti.send(f"{time_str()} 重连成功\n中断{downtime:.1f}秒")
+        outage = None
 
     while True:
+        started_at = time.monotonic()
         try:
-            strategy(e)
+            strategy(e, on_ready=on_ready)
             break
         except KeyboardInterrupt:
-            noti.send(noti.send(f"{time_str()} 手动停止策略运行"))
+            noti.send(f"{time_str()} 手动停止策略运行")
             raise
         except Exception as exc:
-            noti.send(noti.send(f"{time_str()} 程序异常\n{backoff}秒后重启\n{exc}"))
-            time.sleep(backoff)
+            failed_at = time.monotonic()
+            kind = classify_error(exc)
+            dump_debug(e, f"{type(exc).__name__}: {exc}")
+            try:
+                max_backoff = int(e.read_config().get("retry.backoff", 3 * 60))
+            except Exception:
+                max_backoff = 3 * 60
+
+            if failed_at - started_at > retry_stable_seconds:
+                for b in backoffs.values():
+                    b.reset()
+            backoff = backoffs[kind]
+            backoff.cap = max_backoff
+            delay = backoff.next()
+
+            e.logger.exception(f"Strategy failed ({kind.value}), retry in {delay:.3f}s")
+            if outage is None:
+                outage = {"failed_at": failed_at, "attempts": 0}
+                noti.send(f"{time_str()} 程序异常\n{delay:.1f}秒后重连\n{exc}")
+            outage.update(kind=kind.value, error=str(exc))
+            outage["attempts"] += 1
+
+            if kind == ErrorKind.config:
+                # 配置错误时等待配置修改后立即重试
+                deadline = time.monotonic() + delay
+                while time.monotonic() < deadline and not e.poll_config(force=True):
+                    time.sleep(min(0.5, delay))
+            else:
+                time.sleep(delay)
 
 
 app = em.App(
@@ -220,11 +559,14 @@ app = em.App(
     name=strategy_name,
     default_config=config_schema,
     runner=strategy_with_retry,
+    log_files=["output.txt", "tq-debug.txt"],
 )
 
 
 @app.cli.command(name="list")
 def status():
+    now = time.time()
+
     def info(e: em.Execution):
         s = e.status()
         gui = ""
@@ -235,13 +577,139 @@ def status():
                 gui = ""
         config = e.read_config()
 
-        return e.name, config.get("contract.name", ""), s.tr_zh(), gui
+        live = ("",) * 5
+        # 已退出的策略留下的是最后一次的状态, 不再显示
+        if s == em.ExecutionStatus.running and (state := e.state(state_fields)):
+            if snapshot := state.read():
+                live = (
+                    snapshot["last_price"],
+                    int(snapshot["pos_long"]),
+                    f"{int(snapshot['today_target'])}/{int(snapshot['total_target'])}",
+                    f"{now - snapshot['updated_at']:.1f}s",
+                    int(snapshot["iterations"]),
+                )
+            state.close()
+
+        return (e.name, config.get("contract.name", ""), s.tr_zh(), *live, gui)
 
     data = [info(e) for e in app.execution_list()]
 
-    typer.echo(tabulate(data, headers=["震荡策略", "标的合约", "状态", "监控"]))
+    typer.echo(
+        tabulate(
+            data,
+            headers=["震荡策略", "标的合约", "状态", "最新价", "多仓", "今日/总目标", "更新于", "循环次数", "监控"],
+        )
+    )
     typer.echo()
 
 
+# 行情中心只服务行情查看等非交易程序: 策略的 TargetPosTask 下单需要本进程的天勤行情,
+# 改用行情中心不能去掉每个策略的天勤订阅, 反而多一份轮询和行情不一致的问题
+hub_home = app.file("__hub__")
+
+
+@app.cli.command(help="运行行情中心, 每个合约只订阅一次行情并分发给行情查看等非交易程序")
+def hub(
+    name: str = typer.Argument(None, help="使用该策略的天勤账户"),
+    synthetic: bool = typer.Option(False, help="使用本地模拟行情"),
+    rate: float = typer.Option(10, help="模拟行情每秒推送次数"),
+):
+    from md_hub import Hub, SyntheticUpstream, TqUpstream
+
+    if synthetic:
+        upstream = SyntheticUpstream(rate=rate)
+    elif e := app.select_execution(name, "请选择使用哪个策略的天勤账户:"):
+        from tqsdk import TqApi, TqAuth
+
+        config = e.read_config()
+        upstream = TqUpstream(
+            TqApi(auth=TqAuth(config["tq.username"], config["tq.password"]))
+        )
+    else:
+        raise typer.Exit(1)
+
+    typer.echo(f"行情中心 {hub_home}")
+    try:
+        Hub(hub_home, upstream).run()
+    except KeyboardInterrupt:
+        pass
+
+
+@app.cli.command(name="hub-watch", help="查看行情中心的实时行情")
+def hub_watch(symbol: str):
+    from md_hub import Subscriber
+
+    sub = Subscriber(hub_home, symbol)
+    try:
+        while True:
+            for q in sub.read():
+                typer.echo(
+                    f"{q['seq']:>8} {q['last_price']:>10} {q['bid_price1']:>10} {q['ask_price1']:>10} {q['volume']:>10}"
+                )
+            time.sleep(0.1)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        sub.close()
+
+
+cache_home = app.file("__cache__")
+
+
+@app.cli.command(help="下载历史行情到本地缓存, 已缓存的日期不会重复下载")
+def cache(
+    symbol: str = typer.Argument(None, help="合约代码, 默认使用所选策略的合约"),
+    start: str = typer.Option(..., help="起始日期 YYYY-MM-DD"),
+    end: str = typer.Option(None, help="结束日期 YYYY-MM-DD, 默认与起始日期相同"),
+    duration: int = typer.Option(0, help="K线周期秒数, 0 表示 tick"),
+    name: str = typer.Option(None, help="使用该策略的天勤账户"),
+    csv: str = typer.Option(None, help="从本地 CSV 目录读取行情, 不连接天勤"),
+    prune: bool = typer.Option(False, help="删除不再引用的缓存文件"),
+):
+    from md_cache import CsvSource, MarketDataCache, TqSource, kline_kind
+
+    api = None
+    if csv:
+        source = CsvSource(csv)
+    elif e := app.select_execution(name, "请选择使用哪个策略的天勤账户:"):
+        from tqsdk import TqApi, TqAuth
+
+        config = e.read_config()
+        symbol = symbol or config["contract.name"]
+        api = TqApi(auth=TqAuth(config["tq.username"], config["tq.password"]))
+        source = TqSource(api)
+    else:
+        raise typer.Exit(1)
+    if not symbol:
+        typer.echo("请指定合约代码")
+        raise typer.Exit(1)
+
+    start_day = pendulum.parse(start).date()
+    end_day = end and pendulum.parse(end).date() or start_day
+    kind = duration and kline_kind(duration) or "tick"
+    md = MarketDataCache(cache_home, source)
+    try:
+        df = md.get(symbol, kind, start_day, end_day)
+    finally:
+        if api:
+            api.close()
+    typer.echo(f"{symbol} {kind} {start_day} ~ {end_day}: {len(df)} 条")
+    typer.echo(f"缓存命中 {md.hits} 天, 下载 {md.misses} 天 ({cache_home})")
+    if prune:
+        typer.echo(f"删除 {md.prune()} 个缓存文件")
+
+
+@app.cli.command(name="debug-dump", help="将内存中的调试日志写入 tq-debug.txt")
+def debug_dump(name: str = typer.Argument(None)):
+    if not hasattr(signal, "SIGUSR2"):
+        typer.echo("当前系统不支持")
+        raise typer.Exit(1)
+    if e := app.select_execution(name):
+        if e.status() != em.ExecutionStatus.running:
+            typer.echo(f"{e.name} {e.status().tr_zh()}")
+            raise typer.Exit(1)
+        os.kill(e.get_pid(), signal.SIGUSR2)
+
+
 if __name__ == "__main__":
     app.cli()